@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Offline throughput benchmark of weibo.APIClient against benchmarks/mock_server.py.
+
+Measure one configuration:
+
+    python benchmarks/bench_client.py --scenario timeline --transport pool --parser lazy --threads 8
+
+Compare the variants of one dimension, each in a fresh process:
+
+    python benchmarks/bench_client.py --scenario timeline --compare transport
+    python benchmarks/bench_client.py --scenario user --compare parser --tls
+
+The mock server runs in a separate process so that CPU time and peak RSS are the client's only.
+"""
+
+import os
+import io
+import ssl
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import weibo
+
+# scenario -> (http method, api path, parameters):
+SCENARIOS = {
+    'timeline': ('GET', 'statuses/home_timeline', dict(count=200)),
+    'comments': ('GET', 'comments/show', dict(id=11488058246, count=50)),
+    'user': ('GET', 'users/show', dict(uid=1404376560)),
+    'ids': ('GET', 'friendships/followers/ids', dict(uid=1404376560, count=5000)),
+    'remind': ('GET', 'remind/unread_count', dict(uid=1404376560)),
+    'error': ('GET', 'users/show', dict(uid=0)),
+    'update': ('POST', 'statuses/update', dict(status=u'测试 benchmark')),
+    'upload': ('POST', 'statuses/upload', dict(status=u'测试 upload')),
+}
+
+PARSERS = {
+    'jsondict': lambda: None,
+    'lazy': lambda: weibo.json_parser(lazy=True),
+    'records': lambda: weibo.json_parser(records=True),
+    'process': lambda: weibo.ProcessDecoder(min_size=0),
+}
+
+TRANSPORTS = ('pool', 'urlopen', 'async')
+CALLERS = ('chain', 'endpoint', 'prepared')
+
+
+class UrlopenTransport(object):
+    """
+    a new connection for every request through urllib, like the sdk before HttpConnectionPool.
+    """
+    def __init__(self, ssl_context=None):
+        self.ssl_context = ssl_context
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        if body is not None and not isinstance(body, bytes):
+            body = b''.join(body)
+        req = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+        try:
+            return urllib.request.urlopen(req, timeout=timeout, context=self.ssl_context)
+        except urllib.error.HTTPError as e:
+            return e
+
+
+def _ssl_context(base_url):
+    if not base_url.startswith('https://'):
+        return None
+    # the mock server uses a self-signed certificate:
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+def make_client(base_url, transport, parser, threads):
+    scheme, netloc = base_url.split('://', 1)
+    context = _ssl_context(base_url)
+    if transport == 'async':
+        client = weibo.AsyncAPIClient('bench', 'secret', domain=netloc, parser=PARSERS[parser](), max_concurrency=threads,
+                                      pool=weibo.AsyncHttpConnectionPool(maxsize=threads, ssl_context=context))
+    else:
+        pool = weibo.HttpConnectionPool(maxsize=threads, ssl_context=context) if transport == 'pool' else UrlopenTransport(context)
+        client = weibo.APIClient('bench', 'secret', domain=netloc, pool=pool, parser=PARSERS[parser]())
+    client.api_url = '%s://%s/2/' % (scheme, netloc)
+    client.set_access_token('2.00bench_token', time.time() + 86400)
+    return client
+
+
+def make_call(client, scenario, caller):
+    """
+    return a function which sends one request of the scenario.
+    """
+    method, path, params = SCENARIOS[scenario]
+    if scenario == 'upload':
+        pic = b'\x89PNG' + os.urandom(256 * 1024)
+        return lambda: client.endpoint(path, method)(pic=io.BytesIO(pic), **params)
+    if caller == 'prepared':
+        fn = client.prepare(path, method, **params)
+        return lambda: fn()
+    if caller == 'endpoint':
+        fn = client.endpoint(path, method)
+        return lambda: fn(**params)
+    names = path.split('/')
+
+    def _chain():
+        obj = client
+        for name in names:
+            obj = getattr(obj, name)
+        return getattr(obj, method.lower())(**params)
+    return _chain
+
+
+def _percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run_threads(call, requests, threads):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def _worker():
+        local = []
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    break
+            start = time.perf_counter()
+            try:
+                call()
+            except weibo.APIError:
+                errors[0] += 1
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=_worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies, errors[0]
+
+
+def run_async(call, requests, threads):
+    """
+    the pooled connections belong to one event loop, so warm up and measure in the same one.
+    """
+    async def _timed(n):
+        latencies = []
+        errors = [0]
+        # same concurrency as the threads, and latency without the time queued:
+        sem = asyncio.Semaphore(threads)
+
+        async def _one():
+            async with sem:
+                start = time.perf_counter()
+                try:
+                    await call()
+                except weibo.APIError:
+                    errors[0] += 1
+                latencies.append(time.perf_counter() - start)
+        await asyncio.gather(*[_one() for _ in range(n)])
+        return latencies, errors[0]
+
+    async def _main():
+        await _timed(min(threads, requests))
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        latencies, errors = await _timed(requests)
+        return latencies, errors, time.perf_counter() - wall, time.process_time() - cpu
+    return asyncio.run(_main())
+
+
+def run_sync(call, requests, threads):
+    # warm up connections and caches:
+    run_threads(call, min(threads, requests), threads)
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    latencies, errors = run_threads(call, requests, threads)
+    return latencies, errors, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def bench(args):
+    client = make_client(args.server, args.transport, args.parser, args.threads)
+    call = make_call(client, args.scenario, args.caller)
+    runner = run_async if args.transport == 'async' else run_sync
+    latencies, errors, wall, cpu = runner(call, args.requests, args.threads)
+    latencies.sort()
+    return dict(scenario=args.scenario, transport=args.transport, parser=args.parser, caller=args.caller,
+                threads=args.threads, requests=len(latencies), errors=errors,
+                rps=len(latencies) / wall,
+                p50_ms=_percentile(latencies, 0.50) * 1000.0,
+                p99_ms=_percentile(latencies, 0.99) * 1000.0,
+                cpu_ms=cpu * 1000.0 / len(latencies),
+                peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+
+
+def start_server(tls):
+    cmd = [sys.executable, os.path.join(HERE, 'mock_server.py'), '--port', '0']
+    if tls:
+        cmd.append('--tls')
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+    return proc, proc.stdout.readline().strip()
+
+
+def compare(args):
+    variants = dict(transport=TRANSPORTS, parser=sorted(PARSERS), caller=CALLERS)[args.compare]
+    rows = []
+    for v in variants:
+        cmd = [sys.executable, os.path.abspath(__file__), '--json', '--server', args.server,
+               '--scenario', args.scenario, '--transport', args.transport, '--parser', args.parser,
+               '--caller', args.caller, '--threads', str(args.threads), '--requests', str(args.requests),
+               '--%s' % args.compare, v]
+        rows.append(json.loads(subprocess.check_output(cmd, universal_newlines=True)))
+    print_rows(rows)
+
+
+def print_rows(rows):
+    print('%-9s %-9s %-9s %-9s %7s %9s %9s %9s %9s %9s' % (
+        'scenario', 'transport', 'parser', 'caller', 'threads', 'req/s', 'p50 ms', 'p99 ms', 'cpu ms', 'rss MB'))
+    for r in rows:
+        print('%-9s %-9s %-9s %-9s %7d %9.1f %9.2f %9.2f %9.3f %9.1f' % (
+            r['scenario'], r['transport'], r['parser'], r['caller'], r['threads'],
+            r['rps'], r['p50_ms'], r['p99_ms'], r['cpu_ms'], r['peak_rss_mb']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', help='url of a running mock server, default to start one')
+    parser.add_argument('--tls', action='store_true', help='start the mock server with https')
+    parser.add_argument('--scenario', default='timeline', choices=sorted(SCENARIOS))
+    parser.add_argument('--transport', default='pool', choices=TRANSPORTS)
+    parser.add_argument('--parser', default='jsondict', choices=sorted(PARSERS))
+    parser.add_argument('--caller', default='chain', choices=CALLERS)
+    parser.add_argument('--threads', type=int, default=8, help='concurrent requests')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--compare', choices=('transport', 'parser', 'caller'))
+    parser.add_argument('--json', action='store_true', help='print the result as json')
+    args = parser.parse_args()
+    proc = None
+    if not args.server:
+        proc, args.server = start_server(args.tls)
+    try:
+        if args.compare:
+            compare(args)
+        else:
+            r = bench(args)
+            if args.json:
+                print(json.dumps(r))
+            else:
+                print_rows([r])
+    finally:
+        if proc is not None:
+            proc.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare decoding gzip timeline bodies in the request threads against weibo.ProcessDecoder
+with different numbers of worker processes, like a client with many threads in flight:
+
+    python benchmarks/bench_decode.py --threads 16 --bodies 400 --workers 1,2,4,8
+"""
+
+import os
+import sys
+import time
+import zlib
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import weibo
+import payloads
+
+FIELDS = ('id', 'text', 'created_at', 'user.id', 'user.screen_name')
+
+
+def in_thread(body):
+    # what the client does without a ProcessDecoder:
+    return weibo._parse_json(zlib.decompress(body, 16 + zlib.MAX_WBITS))
+
+
+def run(decode, body, bodies, threads):
+    remaining = [bodies]
+    lock = threading.Lock()
+
+    def _worker():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            r = decode(body)
+            # touch the result like the caller would:
+            r['statuses'][-1]['user']['screen_name']
+
+    workers = [threading.Thread(target=_worker) for _ in range(threads)]
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=16, help='request threads decoding at the same time')
+    parser.add_argument('--bodies', type=int, default=200, help='number of 200-status timeline bodies to decode')
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted(set([1, 2, 4, os.cpu_count() or 1]))),
+                        help='comma separated numbers of worker processes')
+    args = parser.parse_args()
+    gz = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    body = gz.compress(payloads.dumps(payloads.timeline(200))) + gz.flush()
+    print('%d cpus, %d KB gzip body, %d threads' % (os.cpu_count() or 1, len(body) // 1024, args.threads))
+    print('%-8s %7s %-6s %10s %10s %10s' % ('mode', 'workers', 'fields', 'bodies/s', 'speedup', 'parent cpu'))
+    wall, cpu = run(in_thread, body, args.bodies, args.threads)
+    base = args.bodies / wall
+    print('%-8s %7s %-6s %10.1f %10.2f %9.1f%%' % ('thread', '-', 'all', base, 1.0, cpu * 100.0 / wall))
+    for n in [int(n) for n in args.workers.split(',')]:
+        for fields in (None, FIELDS):
+            # min_size=0 sends every body to the workers:
+            with weibo.ProcessDecoder(max_workers=n, fields=fields, min_size=0) as decoder:
+                # start the workers before measuring:
+                run(decoder, body, n, n)
+                wall, cpu = run(decoder, body, args.bodies, args.threads)
+            rate = args.bodies / wall
+            print('%-8s %7d %-6s %10.1f %10.2f %9.1f%%' % (
+                'process', n, 'all' if fields is None else 'some', rate, rate / base, cpu * 100.0 / wall))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare memory and parse time of JsonDict and the __slots__ records of weibo.json_parser(records=True).
+
+    python benchmarks/bench_records.py --pages 50
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import weibo
+import payloads
+
+PARSERS = {
+    'jsondict': weibo._parse_json,
+    'lazy': weibo.json_parser(lazy=True),
+    'records': weibo.json_parser(records=True),
+}
+
+
+def measure(name, parse, body, pages):
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = [parse(body) for _ in range(pages)]
+    elapsed = time.perf_counter() - start
+    if name == 'lazy':
+        # touch every status so that the lazy objects are materialized like the others:
+        for page in kept:
+            for st in page.statuses:
+                st.user.screen_name
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    items = pages * len(kept[0]['statuses'])
+    print('%-10s %8.2f ms/page %10.1f bytes/status %8.1f MB retained' % (
+        name, elapsed * 1000.0 / pages, current / float(items), current / 1048576.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=20, help='number of 200-status timeline pages to keep')
+    parser.add_argument('--parsers', default=','.join(sorted(PARSERS)))
+    args = parser.parse_args()
+    body = payloads.dumps(payloads.timeline(200))
+    for name in args.parsers.split(','):
+        measure(name, PARSERS[name], body, args.pages)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Throughput benchmark of snspy.APIClient against a running benchmarks/mock_server.py.
+
+snspy.py is python 2 only, so start the mock server with python 3 and point this script at it:
+
+    python3 benchmarks/mock_server.py --port 8000 &
+    python2 benchmarks/bench_snspy.py --server http://127.0.0.1:8000 --scenario timeline --threads 8
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+import json
+import logging
+import argparse
+import resource
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import snspy
+
+# scenario -> (http method, api path, parameters):
+SCENARIOS = {
+    'timeline': ('GET', 'statuses/home_timeline', dict(count=200)),
+    'comments': ('GET', 'comments/show', dict(id=11488058246, count=50)),
+    'user': ('GET', 'users/show', dict(uid=1404376560)),
+    'ids': ('GET', 'friendships/followers/ids', dict(uid=1404376560, count=5000)),
+    'remind': ('GET', 'remind/unread_count', dict(uid=1404376560)),
+    'error': ('GET', 'users/show', dict(uid=0)),
+    'update': ('POST', 'statuses/update', dict(status='benchmark')),
+}
+
+
+class LocalWeiboMixin(snspy.SinaWeiboMixin):
+    """
+    send the sina weibo api calls to the mock server.
+    """
+    base_url = 'http://127.0.0.1:8000'
+
+    def _prepare_api(self, method, path, access_token, **kw):
+        method, the_url, headers, kw = snspy.SinaWeiboMixin._prepare_api(self, method, path, access_token, **kw)
+        for host in ('https://api.weibo.com', 'https://rm.api.weibo.com'):
+            the_url = the_url.replace(host, self.base_url)
+        return method, the_url, headers, kw
+
+
+def run(client, scenario, requests, threads):
+    method, path, params = SCENARIOS[scenario]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def _worker():
+        local = []
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    break
+                remaining[0] -= 1
+            start = time.time()
+            try:
+                client.call_api(method, path, **params)
+            except snspy.APIError:
+                errors[0] += 1
+            local.append(time.time() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=_worker) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', default=LocalWeiboMixin.base_url, help='url of the running mock server')
+    parser.add_argument('--scenario', default='timeline', choices=sorted(SCENARIOS))
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='print the result as json')
+    args = parser.parse_args()
+    # snspy logs every request at error level:
+    logging.disable(logging.ERROR)
+    LocalWeiboMixin.base_url = args.server.rstrip('/')
+    client = snspy.APIClient(LocalWeiboMixin, 'bench', 'secret', access_token='2.00bench_token', expires=time.time() + 86400)
+    cpu = time.clock()
+    wall = time.time()
+    latencies, errors = run(client, args.scenario, args.requests, args.threads)
+    wall = time.time() - wall
+    cpu = time.clock() - cpu
+    latencies.sort()
+    n = len(latencies)
+    r = dict(scenario=args.scenario, transport='snspy', threads=args.threads, requests=n, errors=errors,
+             rps=n / wall,
+             p50_ms=latencies[int(n * 0.50)] * 1000.0,
+             p99_ms=latencies[min(n - 1, int(n * 0.99))] * 1000.0,
+             cpu_ms=cpu * 1000.0 / n,
+             peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0)
+    if args.json:
+        print(json.dumps(r))
+    else:
+        print('%-9s %-9s %7s %9s %9s %9s %9s %9s' % ('scenario', 'transport', 'threads', 'req/s', 'p50 ms', 'p99 ms', 'cpu ms', 'rss MB'))
+        print('%-9s %-9s %7d %9.1f %9.2f %9.2f %9.3f %9.1f' % (
+            r['scenario'], r['transport'], r['threads'], r['rps'], r['p50_ms'], r['p99_ms'], r['cpu_ms'], r['peak_rss_mb']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in of api.weibo.com and rm.api.weibo.com for benchmarks.
+
+    python benchmarks/mock_server.py --port 8000 [--tls]
+
+It serves gzip-compressed payloads of benchmarks/payloads.py:
+
+    GET  /2/statuses/*_timeline.json      200 statuses
+    GET  /2/comments/show.json            50 comments
+    GET  /2/users/show.json               a user, error 20003 if uid=0
+    GET  /2/friendships/*/ids.json        5000 ids, paged by cursor
+    GET  /2/remind/unread_count.json      remind counters
+    POST /2/statuses/update.json          a status
+    POST /2/statuses/upload.json          a status, the multipart body is drained
+    *    /2/error/<code>.json             api error <code>
+    *    /oauth2/access_token             a new access token
+"""
+
+import os
+import ssl
+import sys
+import gzip
+import argparse
+import tempfile
+import threading
+import subprocess
+
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import payloads
+
+
+def _gzip(obj):
+    return gzip.compress(payloads.dumps(obj), 6)
+
+
+class _Payloads(object):
+
+    def __init__(self):
+        self.timeline = _gzip(payloads.timeline(200))
+        self.comments = _gzip(payloads.comments(50))
+        self.user = _gzip(payloads.user(1))
+        self.ids = [_gzip(payloads.ids(5000, next_cursor=5000 * (i + 1) if i < 3 else 0)) for i in range(4)]
+        self.status = _gzip(payloads.status(1))
+        self.unread = _gzip({'status': 0, 'follower': 3, 'cmt': 1, 'dm': 0, 'mention_status': 2, 'mention_cmt': 0})
+        self.token = _gzip({'access_token': '2.00mock_token', 'expires_in': 157679999, 'remind_in': '157679999', 'uid': '1404376560'})
+
+
+class MockWeiboHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body leave in one segment, keep-alive clients would otherwise hit the delayed ack:
+    disable_nagle_algorithm = True
+    payloads = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=UTF-8')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def _error(self, code, message, status=400):
+        self._reply(_gzip({'error_code': int(code), 'error': message, 'request': self.path.split('?')[0]}), status)
+
+    def _route(self, method):
+        url = urlsplit(self.path)
+        path = url.path
+        qs = parse_qs(url.query)
+        if method == 'POST':
+            # drain the body, multipart uploads included:
+            left = int(self.headers.get('Content-Length', 0))
+            while left > 0:
+                left -= len(self.rfile.read(min(left, 65536)))
+        p = self.payloads
+        if path.startswith('/2/error/'):
+            return self._error(path[len('/2/error/'):-len('.json')], 'mock error')
+        if path == '/oauth2/access_token':
+            return self._reply(p.token)
+        if method == 'GET':
+            if path.endswith('_timeline.json'):
+                return self._reply(p.timeline)
+            if path == '/2/comments/show.json':
+                return self._reply(p.comments)
+            if path == '/2/users/show.json':
+                if qs.get('uid') == ['0']:
+                    return self._error(20003, 'User does not exists')
+                return self._reply(p.user)
+            if path.startswith('/2/friendships/') and path.endswith('/ids.json'):
+                page = int(qs.get('cursor', ['0'])[0]) // 5000
+                return self._reply(p.ids[min(page, len(p.ids) - 1)])
+            if path == '/2/remind/unread_count.json':
+                return self._reply(p.unread)
+        elif path in ('/2/statuses/update.json', '/2/statuses/upload.json'):
+            return self._reply(p.status)
+        self._error(10014, 'Request api not found!', 404)
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+
+def _self_signed_cert(directory):
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-subj', '/CN=127.0.0.1', '-keyout', keyfile, '-out', certfile],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certfile, keyfile
+
+
+class _MockServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # benchmark clients drop idle keep-alive connections when they exit:
+        if not isinstance(sys.exc_info()[1], (ConnectionError, ssl.SSLError)):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+def start(host='127.0.0.1', port=0, tls=False, certfile=None, keyfile=None):
+    """
+    start the mock server in a background thread and return it, server.base_url is like 'http://127.0.0.1:8000'.
+    """
+    MockWeiboHandler.payloads = MockWeiboHandler.payloads or _Payloads()
+    server = _MockServer((host, port), MockWeiboHandler)
+    scheme = 'http'
+    if tls:
+        if not certfile:
+            certfile, keyfile = _self_signed_cert(tempfile.mkdtemp())
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    server.base_url = '%s://%s:%d' % (scheme, host, server.server_address[1])
+    t = threading.Thread(target=server.serve_forever, name='mock-weibo')
+    t.daemon = True
+    t.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='local mock of the sina weibo api')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--tls', action='store_true', help='serve https with a self-signed certificate')
+    parser.add_argument('--certfile')
+    parser.add_argument('--keyfile')
+    args = parser.parse_args()
+    server = start(args.host, args.port, args.tls, args.certfile, args.keyfile)
+    print(server.base_url)
+    sys.stdout.flush()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Realistic sina weibo api payloads for benchmarks.
+"""
+
+import json
+
+
+def user(i):
+    return {
+        'id': 1404376560 + i, 'idstr': str(1404376560 + i), 'screen_name': 'user%d' % i, 'name': 'user%d' % i,
+        'province': '11', 'city': '5', 'location': u'北京 朝阳区',
+        'description': u'人生五十年，乃如梦如幻；有生斯有死，壮士复何憾。',
+        'url': 'http://blog.sina.com.cn/user%d' % i,
+        'profile_image_url': 'http://tp1.sinaimg.cn/%d/50/0/1' % (1404376560 + i),
+        'profile_url': 'u/%d' % (1404376560 + i), 'domain': 'user%d' % i, 'weihao': '', 'gender': 'm',
+        'followers_count': 1204, 'friends_count': 447, 'statuses_count': 2908, 'favourites_count': 0,
+        'created_at': 'Fri Aug 28 00:00:00 +0800 2009', 'following': False, 'allow_all_act_msg': False,
+        'geo_enabled': True, 'verified': False, 'verified_type': -1, 'remark': '', 'allow_all_comment': True,
+        'avatar_large': 'http://tp1.sinaimg.cn/%d/180/0/1' % (1404376560 + i), 'verified_reason': '',
+        'follow_me': False, 'online_status': 0, 'bi_followers_count': 215, 'lang': 'zh-cn',
+    }
+
+
+def status(i):
+    return {
+        'created_at': 'Tue May 31 17:46:55 +0800 2011', 'id': 11488058246 + i, 'mid': str(5612814510546515491 + i),
+        'idstr': str(11488058246 + i), 'text': u'求关注。#新浪微博# 今天天气不错，出去走走 http://t.cn/zOXAaic',
+        'source': u'<a href="http://weibo.com" rel="nofollow">新浪微博</a>', 'favorited': False, 'truncated': False,
+        'in_reply_to_status_id': '', 'in_reply_to_user_id': '', 'in_reply_to_screen_name': '', 'geo': None,
+        'reposts_count': 8, 'comments_count': 9, 'attitudes_count': 0, 'mlevel': 0,
+        'visible': {'type': 0, 'list_id': 0},
+        'pic_urls': [{'thumbnail_pic': 'http://ww1.sinaimg.cn/thumbnail/%x.jpg' % i}],
+        'user': user(i % 50),
+    }
+
+
+def comment(i):
+    return {
+        'created_at': 'Wed Jun 01 00:50:25 +0800 2011', 'id': 12438492184 + i, 'idstr': str(12438492184 + i),
+        'mid': str(202110601896455629 + i), 'text': u'循环引用，一直都是个麻烦。', 'source': u'<a href="http://weibo.com">新浪微博</a>',
+        'user': user(i % 50), 'status': status(i),
+    }
+
+
+def timeline(count=200):
+    return {'statuses': [status(i) for i in range(count)], 'hasvisible': False,
+            'previous_cursor': 0, 'next_cursor': 11488013766, 'total_number': 81655}
+
+
+def comments(count=50):
+    return {'comments': [comment(i) for i in range(count)],
+            'previous_cursor': 0, 'next_cursor': 0, 'total_number': count}
+
+
+def ids(count=5000, next_cursor=0):
+    return {'ids': [2000000000 + i for i in range(count)],
+            'next_cursor': next_cursor, 'previous_cursor': 0, 'total_number': count}
+
+
+def dumps(obj):
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
@@ -23,7 +23,7 @@ import base64
 import urllib
 import urllib2
 import urlparse
-import gzip
+import zlib
 
 import logging
 import mimetypes
@@ -155,20 +155,39 @@ _HTTP_POST = 'POST'
 _HTTP_UPLOAD = 'UPLOAD'
 
 
-def _read_http_body(http_obj):
-    using_gzip = http_obj.headers.get('Content-Encoding', '') == 'gzip'
-    body = http_obj.read()
-    if using_gzip:
-        gzipper = gzip.GzipFile(fileobj=StringIO(body))
-        fcontent = gzipper.read()
-        gzipper.close()
-        return fcontent
-    return body
+_READ_CHUNK_SIZE = 64 * 1024
 
 
-def _http(method, url, headers=None, **kw):
+def _read_http_body(http_obj, max_size=None):
+    '''
+    Read http body chunk by chunk, gzip content is inflated incrementally while reading.
+    '''
+    using_gzip = http_obj.headers.get('Content-Encoding', '') == 'gzip'
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if using_gzip else None
+    chunks = []
+    size = 0
+    while True:
+        data = http_obj.read(_READ_CHUNK_SIZE)
+        if not data:
+            break
+        while data:
+            if decompressor is None:
+                chunk, data = data, ''
+            else:
+                chunk = decompressor.decompress(data, _READ_CHUNK_SIZE)
+                data = decompressor.unconsumed_tail
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise IOError('response body exceeds %d bytes' % max_size)
+            chunks.append(chunk)
+    if decompressor is not None:
+        chunks.append(decompressor.flush())
+    return ''.join(chunks)
+
+
+def _http(method, url, headers=None, max_body_size=None, **kw):
     '''
-    Send http request and return response text.
+    Send http request and return response text, which is limited to max_body_size bytes if given.
     '''
     params = None
     boundary = None
@@ -188,7 +207,7 @@ def _http(method, url, headers=None, **kw):
         req.add_header('Content-Type', 'multipart/form-data; boundary=%s' % boundary)
     try:
         resp = urllib2.urlopen(req, timeout=5)
-        return _read_http_body(resp)
+        return _read_http_body(resp, max_body_size)
     finally:
         pass
 
@@ -352,12 +371,14 @@ class QQMixin(SNSMixin):
 
 class APIClient(object):
     '''
-    API client using synchronized invocation.
+    API client using synchronized invocation. api responses larger than max_body_size bytes
+    raise IOError.
     '''
-    def __init__(self, mixin, app_key, app_secret, redirect_uri='', access_token='', expires=0.0):
+    def __init__(self, mixin, app_key, app_secret, redirect_uri='', access_token='', expires=0.0, max_body_size=None):
         self._mixin = mixin(app_key, app_secret, redirect_uri)
         self._access_token = str(access_token)
         self._expires = expires
+        self._max_body_size = max_body_size
 
     def set_access_token(self, access_token, expires):
         self._access_token = str(access_token)
@@ -398,7 +419,7 @@ class APIClient(object):
         method, the_url, headers, params = self._mixin._prepare_api(http_method, http_path, self._access_token, **kw)
         logging.debug('Call API: %s: %s' % (method, the_url))
         try:
-            resp = _http(method, the_url, headers, **params)
+            resp = _http(method, the_url, headers, self._max_body_size, **params)
         except urllib2.HTTPError, e:
             return self._mixin.on_http_error(e)
         r = _parse_json(resp)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-__version__ = '1.1.4'
+__version__ = '1.2.0'
 __author__ = 'Liao Xuefeng (askxuefeng@gmail.com)'
 
 """
@@ -10,21 +10,37 @@ Python client SDK for sina weibo API using OAuth 2.
 
 from io import BytesIO
 
+import os
 import time
 import json
 
 import hmac
 import hashlib
 import base64
+import bisect
+import pickle
+import random
+import sqlite3
 
-from urllib.parse import quote
-from urllib.request import Request, urlopen
+from urllib.parse import quote, urlsplit
 from urllib.error import HTTPError
-import gzip
+import http.client
+import zlib
+import codecs
+import struct
 
 import logging
 import mimetypes
 import collections
+import queue
+import threading
+import weakref
+import asyncio
+import concurrent.futures
+import functools
+import array
+import ssl
+import email.parser
 
 
 class APIError(Exception):
@@ -41,16 +57,28 @@ class APIError(Exception):
         return 'APIError: %s: %s, request: %s' % (self.error_code, self.error, self.request)
 
 
+class DeadlineExceeded(TimeoutError):
+    """
+    raise DeadlineExceeded if an api call cannot be sent before its deadline.
+    """
+    pass
+
+
+try:
+    import orjson as _fast_json
+except ImportError:
+    _fast_json = None
+
+
 def _parse_json(s):
-    """parse str into JsonDict"""
+    """
+    parse str into JsonDict
 
-    def _obj_hook(pairs):
-        """convert json object to python object"""
-        o = JsonDict()
-        for k, v in pairs.items():
-            o[str(k)] = v
-        return o
-    return json.loads(s, object_hook=_obj_hook)
+    >>> r = _parse_json(b'{"statuses":[{"user":{"screen_name":"Michael"}}]}')
+    >>> r.statuses[0].user.screen_name
+    'Michael'
+    """
+    return json.loads(s, object_hook=JsonDict)
 
 
 class JsonDict(dict):
@@ -66,6 +94,206 @@ class JsonDict(dict):
         self[attr] = value
 
 
+class LazyJsonDict(JsonDict):
+    """
+    JsonDict which wraps nested objects into LazyJsonDict only when they are accessed,
+    by attribute, item, get(), values() or items().
+
+    >>> r = LazyJsonDict({'statuses': [{'user': {'screen_name': 'Michael'}}]})
+    >>> r.statuses[0].user.screen_name
+    'Michael'
+    >>> type(r['statuses'][0]).__name__, type(r.get('statuses')[0]).__name__
+    ('LazyJsonDict', 'LazyJsonDict')
+
+    results of a client using json_parser(lazy=True) can be read as attributes everywhere:
+
+    >>> client = APIClient('key', 'secret', parser=json_parser(lazy=True))
+    >>> client._call = lambda method, path, kw, deadline=None: client.parser(b'{"statuses": [{"id": 1, "text": "hi"}]}')
+    >>> [st.text for st in client.iterate('statuses/user_timeline', uid=123)]
+    ['hi']
+    """
+
+    def __getattr__(self, attr):
+        try:
+            return self[attr]
+        except KeyError:
+            raise AttributeError(r"'LazyJsonDict' object has no attribute '%s'" % attr)
+
+    def __getitem__(self, key):
+        v = dict.__getitem__(self, key)
+        t = type(v)
+        if t is dict or t is list:
+            v = _lazy(v)
+            dict.__setitem__(self, key, v)
+        return v
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[k] for k in self]
+
+    def items(self):
+        return [(k, self[k]) for k in self]
+
+
+class _LazyList(list):
+    """list whose dict items are already wrapped into LazyJsonDict"""
+    pass
+
+
+def _lazy(o):
+    t = type(o)
+    if t is dict:
+        return LazyJsonDict(o)
+    if t is list:
+        return _LazyList([_lazy(x) if type(x) in (dict, list) else x for x in o])
+    return o
+
+
+class _Record(object):
+    """
+    base class of compact result records. known fields are stored in __slots__,
+    other fields go into an overflow dict, both are accessed as attributes or items.
+    """
+    __slots__ = ('_extra',)
+    _fields = frozenset()
+
+    def __init__(self, pairs):
+        extra = None
+        fields = self._fields
+        for k, v in pairs.items():
+            if k in fields:
+                object.__setattr__(self, k, v)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[k] = v
+        object.__setattr__(self, '_extra', extra)
+
+    def __getattr__(self, attr):
+        # only called for fields that are unset or not in __slots__:
+        if attr != '_extra':
+            extra = self._extra
+            if extra and attr in extra:
+                return extra[attr]
+        raise AttributeError(r"'%s' object has no attribute '%s'" % (self.__class__.__name__, attr))
+
+    def __setattr__(self, attr, value):
+        if attr in self._fields:
+            object.__setattr__(self, attr, value)
+        else:
+            if self._extra is None:
+                object.__setattr__(self, '_extra', {})
+            self._extra[attr] = value
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        d = dict((k, getattr(self, k)) for k in self.__slots__ if hasattr(self, k))
+        if self._extra:
+            d.update(self._extra)
+        return d
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(state)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.to_dict())
+
+
+def _record_class(name, fields):
+    fields = tuple(fields.split())
+    return type(name, (_Record,), dict(__slots__=fields, _fields=frozenset(fields)))
+
+
+Status = _record_class('Status', '''
+    id idstr mid created_at text source favorited truncated in_reply_to_status_id in_reply_to_user_id
+    in_reply_to_screen_name thumbnail_pic bmiddle_pic original_pic pic_urls geo user retweeted_status
+    reposts_count comments_count attitudes_count mlevel visible''')
+
+User = _record_class('User', '''
+    id idstr screen_name name province city location description url profile_image_url profile_url
+    domain weihao gender followers_count friends_count statuses_count favourites_count created_at
+    following allow_all_act_msg geo_enabled verified verified_type verified_reason remark status
+    allow_all_comment avatar_large avatar_hd follow_me online_status bi_followers_count lang''')
+
+Comment = _record_class('Comment', '''
+    id idstr mid created_at text source user status reply_comment''')
+
+Page = _record_class('Page', '''
+    statuses comments reposts users ids favorites previous_cursor next_cursor total_number
+    hasvisible interval''')
+
+
+def _record_hook(o):
+    """object_hook which decodes statuses, users, comments and cursor envelopes into records"""
+    if 'next_cursor' in o or 'total_number' in o:
+        return Page(o)
+    if 'text' in o and 'id' in o:
+        return Comment(o) if 'status' in o or 'reply_comment' in o else Status(o)
+    if 'screen_name' in o and 'followers_count' in o:
+        return User(o)
+    return JsonDict(o)
+
+
+def _to_json_dict(o):
+    t = type(o)
+    if t is dict:
+        d = JsonDict(o)
+        for k, v in d.items():
+            if type(v) in (dict, list):
+                d[k] = _to_json_dict(v)
+        return d
+    if t is list:
+        return [_to_json_dict(x) if type(x) in (dict, list) else x for x in o]
+    return o
+
+
+def json_parser(loads=None, lazy=False, records=False):
+    """
+    return a parser for APIClient(parser=...).
+
+    loads is the json decoding function. if lazy is True, objects are parsed into LazyJsonDict
+    which only wraps nested objects on access, and loads defaults to orjson.loads if orjson is installed.
+    that is several times faster than the default JsonDict parsing for large responses.
+    if records is True, statuses, users, comments and cursor envelopes are decoded into
+    the __slots__ based Status, User, Comment and Page records, which take much less memory.
+
+    >>> parse = json_parser(loads=json.loads, lazy=True)
+    >>> r = parse(b'{"statuses":[{"id":1}],"total_number":1}')
+    >>> r.statuses[0].id, r.total_number
+    (1, 1)
+    >>> r = json_parser(records=True)(b'{"statuses":[{"id":1,"text":"hi","user":{"screen_name":"a","followers_count":0}}],"next_cursor":0}')
+    >>> r.statuses[0].user
+    User({'screen_name': 'a', 'followers_count': 0})
+    """
+    if records:
+        return lambda s: json.loads(s, object_hook=_record_hook)
+    if lazy:
+        if loads is None:
+            loads = _fast_json.loads if _fast_json else json.loads
+        return lambda s: _lazy(loads(s))
+    if loads is None or loads is json.loads:
+        return _parse_json
+    return lambda s: _to_json_dict(loads(s))
+
+
 def _encode_params(**kw):
     """
     do url-encode parameters
@@ -90,24 +318,81 @@ def _encode_params(**kw):
 
 
 def _encode_multipart(**kw):
-    """build a multipart/form-data body with randomly generated boundary"""
+    """
+    build a multipart/form-data body with randomly generated boundary.
+    the body is a _MultipartBody which streams file-like objects in chunks.
+
+    >>> body, boundary = _encode_multipart(status='hi', pic=BytesIO(b'PNG-DATA'))
+    >>> data = b''.join(body)
+    >>> len(data) == len(body)
+    True
+    >>> data.count(b'PNG-DATA'), data.endswith(('--%s--\\r\\n' % boundary).encode())
+    (1, True)
+    """
     boundary = '----------%s' % hex(int(time.time() * 1000))
-    data = []
+    parts = []
     for k, v in kw.items():
-        data.append('--%s' % boundary)
         if hasattr(v, 'read'):
             # file-like object:
             filename = getattr(v, 'name', '')
-            content = v.read()
-            data.append('Content-Disposition: form-data; name="%s"; filename="hidden"' % k)
-            data.append('Content-Length: %d' % len(content))
-            data.append('Content-Type: %s\r\n' % _guess_content_type(filename))
-            data.append(content)
+            size = _stream_size(v)
+            if size is None:
+                v = BytesIO(v.read())
+                size = len(v.getvalue())
+            parts.append(('--%s\r\n'
+                          'Content-Disposition: form-data; name="%s"; filename="hidden"\r\n'
+                          'Content-Length: %d\r\n'
+                          'Content-Type: %s\r\n\r\n' % (boundary, k, size, _guess_content_type(filename))).encode('utf-8'))
+            parts.append((v, size))
+            parts.append(b'\r\n')
         else:
-            data.append('Content-Disposition: form-data; name="%s"\r\n' % k)
-            data.append(v.encode('utf-8') if isinstance(v, str) else v)
-    data.append('--%s--\r\n' % boundary)
-    return '\r\n'.join(data), boundary
+            parts.append(('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n' % (boundary, k)).encode('utf-8'))
+            parts.append(v if isinstance(v, bytes) else str(v).encode('utf-8'))
+            parts.append(b'\r\n')
+    parts.append(('--%s--\r\n' % boundary).encode('utf-8'))
+    return _MultipartBody(parts), boundary
+
+
+def _stream_size(f):
+    """return the number of bytes left in a file-like object, or None if it cannot be told without reading"""
+    try:
+        return os.fstat(f.fileno()).st_size - f.tell()
+    except (AttributeError, OSError, ValueError):
+        pass
+    try:
+        pos = f.tell()
+        end = f.seek(0, os.SEEK_END)
+        f.seek(pos)
+        return end - pos
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class _MultipartBody(object):
+    """
+    an iterable multipart body which reads files in chunks, len() returns the Content-Length.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, parts):
+        self._parts = parts
+        self._length = sum(p[1] if isinstance(p, tuple) else len(p) for p in parts)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for part in self._parts:
+            if not isinstance(part, tuple):
+                yield part
+                continue
+            f, left = part
+            while left > 0:
+                chunk = f.read(min(self.chunk_size, left))
+                if not chunk:
+                    raise IOError('file is shorter than its expected size')
+                left -= len(chunk)
+                yield chunk
 
 
 def _guess_content_type(url):
@@ -124,66 +409,1181 @@ _HTTP_UPLOAD = 2
 
 
 def _http_get(url, authorization=None, **kw):
-    logging.info('GET %s' % url)
+    logging.info('GET %s', url)
     return _http_call(url, _HTTP_GET, authorization, **kw)
 
 
 def _http_post(url, authorization=None, **kw):
-    logging.info('POST %s' % url)
+    logging.info('POST %s', url)
     return _http_call(url, _HTTP_POST, authorization, **kw)
 
 
 def _http_upload(url, authorization=None, **kw):
-    logging.info('MULTIPART POST %s' % url)
+    logging.info('MULTIPART POST %s', url)
     return _http_call(url, _HTTP_UPLOAD, authorization, **kw)
 
 
-def _read_body(obj):
-    using_gzip = obj.headers.get('Content-Encoding', '') == 'gzip'
-    body = obj.read()
-    if using_gzip:
-        gzipper = gzip.GzipFile(fileobj=BytesIO(body))
-        fcontent = gzipper.read()
-        gzipper.close()
-        return fcontent
+_READ_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_body(obj, max_size=None, timing=None, inflate=True):
+    """
+    yield the decoded body of a response chunk by chunk while it is read from the socket.
+    gzip content is inflated incrementally unless inflate is False, raise HTTPException if more
+    than max_size bytes are decoded. time spent on reading and inflating is added to timing.body
+    and timing.gunzip if timing is given.
+    """
+    decompressor = None
+    if inflate and obj.headers.get('Content-Encoding', '') == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    size = 0
+    while True:
+        if timing is None:
+            data = obj.read(_READ_CHUNK_SIZE)
+        else:
+            start = time.perf_counter()
+            data = obj.read(_READ_CHUNK_SIZE)
+            timing.body += time.perf_counter() - start
+        if not data:
+            break
+        while data:
+            if decompressor is None:
+                chunk, data = data, b''
+            else:
+                if timing is not None:
+                    start = time.perf_counter()
+                # bound the output of each step so a small gzip bomb cannot expand at once:
+                chunk = decompressor.decompress(data, _READ_CHUNK_SIZE)
+                data = decompressor.unconsumed_tail
+                if timing is not None:
+                    timing.gunzip += time.perf_counter() - start
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise http.client.HTTPException('response body exceeds max_body_size of %d bytes' % max_size)
+            if chunk:
+                yield chunk
+    if decompressor is not None:
+        chunk = decompressor.flush()
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise http.client.HTTPException('response body exceeds max_body_size of %d bytes' % max_size)
+        if chunk:
+            yield chunk
+
+
+def _read_body(obj, max_size=None, timing=None, inflate=True):
+    body = bytearray()
+    for chunk in _iter_body(obj, max_size, timing, inflate):
+        body += chunk
     return body
 
 
+class _PooledResponse(object):
+    """
+    wrap a http.client response and give the connection back to the pool once the body is consumed.
+    """
+    def __init__(self, pool, key, conn, resp):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = resp.headers
+
+    def read(self, amt=None):
+        data = self._resp.read(amt)
+        if self._resp.isclosed():
+            self.close()
+        return data
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            # a response closed before it was fully read leaves unread bytes on the socket:
+            self._pool._release(self._key, conn, reusable=self._resp.isclosed())
+            self._resp.close()
+
+
+class HttpConnectionPool(object):
+    """
+    thread-safe pool of keep-alive http/https connections.
+
+    At most maxsize connections are opened for each (scheme, host), callers block until
+    one of them is released, or raise DeadlineExceeded after the request timeout.
+    Idle connections are closed after idle_timeout seconds.
+    """
+    def __init__(self, maxsize=10, idle_timeout=60.0, ssl_context=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.ssl_context = ssl_context
+        self._cond = threading.Condition()
+        self._idle = {}
+        self._busy = {}
+        self._reaper = None
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None, timing=None):
+        """
+        send a request and return a response object with status, headers and read().
+        the connect, tls and ttfb phases are recorded if timing is given.
+        """
+        scheme, netloc, path, query, _ = urlsplit(url)
+        key = (scheme, netloc)
+        target = '%s?%s' % (path, query) if query else path
+        conn, reused = self._acquire(key, timeout)
+        try:
+            if timing is not None:
+                timing.reused = reused
+                if not reused:
+                    self._connect(conn, timing)
+                start = time.perf_counter()
+            try:
+                resp = self._send(conn, method, target, body, headers, timeout)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # the server closed an idle keep-alive connection, try once more on a new socket:
+                if not reused or not (body is None or isinstance(body, bytes)):
+                    raise
+                conn.close()
+                resp = self._send(conn, method, target, body, headers, timeout)
+        except:
+            self._release(key, conn, reusable=False)
+            raise
+        if timing is not None:
+            timing.ttfb = time.perf_counter() - start
+        return _PooledResponse(self, key, conn, resp)
+
+    def clear(self):
+        """
+        close all idle connections.
+        """
+        with self._cond:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def _send(self, conn, method, target, body, headers, timeout):
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        conn.request(method, target, body, headers or {})
+        return conn.getresponse()
+
+    def _connect(self, conn, timing):
+        # time the tcp connect apart from the whole connect() which includes the tls handshake:
+        create_connection = conn._create_connection
+        tcp = [0.0]
+
+        def _create_connection(*args, **kw):
+            start = time.perf_counter()
+            sock = create_connection(*args, **kw)
+            tcp[0] = time.perf_counter() - start
+            return sock
+        conn._create_connection = _create_connection
+        try:
+            start = time.perf_counter()
+            conn.connect()
+            elapsed = time.perf_counter() - start
+        finally:
+            conn._create_connection = create_connection
+        timing.connect = tcp[0]
+        if isinstance(conn, http.client.HTTPSConnection):
+            timing.tls = elapsed - tcp[0]
+
+    def _new_connection(self, key, timeout):
+        scheme, netloc = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(netloc, timeout=timeout)
+
+    def _acquire(self, key, timeout):
+        expires = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                self._evict(time.time())
+                idle = self._idle.get(key)
+                if idle:
+                    conn, _ = idle.pop()
+                    self._busy[key] += 1
+                    return conn, True
+                if self._busy.get(key, 0) < self.maxsize:
+                    self._busy[key] = self._busy.get(key, 0) + 1
+                    break
+                wait = None if expires is None else expires - time.time()
+                if wait is not None and wait <= 0:
+                    raise DeadlineExceeded('no connection to %s available within %s seconds' % (key[1], timeout))
+                self._cond.wait(wait)
+        return self._new_connection(key, timeout), False
+
+    def _release(self, key, conn, reusable=True):
+        if not reusable:
+            conn.close()
+        with self._cond:
+            self._busy[key] -= 1
+            if reusable:
+                self._idle.setdefault(key, []).append((conn, time.time()))
+                self._start_reaper()
+            self._cond.notify()
+
+    def _evict(self, now):
+        # must be called with self._cond held:
+        expired = now - self.idle_timeout
+        for key, idle in self._idle.items():
+            while idle and idle[0][1] < expired:
+                idle.pop(0)[0].close()
+
+    def _start_reaper(self):
+        # must be called with self._cond held:
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap, name='weibo-pool-reaper')
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 2.0, 1.0))
+            with self._cond:
+                self._evict(time.time())
+                if not any(self._idle.values()):
+                    self._reaper = None
+                    return
+
+
+_default_pool = HttpConnectionPool()
+
+
+# socket timeouts in seconds of endpoints which are much faster or slower than the others:
+_DEFAULT_TIMEOUTS = {
+    'remind/unread_count': 2.0,
+    'statuses/upload': 60.0,
+    'statuses/upload_url_text': 30.0,
+}
+
+
 def _http_call(the_url, method, authorization, **kw):
     """
     send an http request and return a json object if no error occurred.
     """
+    return _http_request(_default_pool, the_url, method, authorization, kw)
+
+
+def _http_request(pool, the_url, method, authorization, kw, max_body_size=None, parser=_parse_json, timing=None, timeout=5.0):
+    """
+    send an http request through the connection pool and return a json object if no error occurred.
+    the phases of the request are recorded if timing is given.
+    """
+    if timing is not None:
+        return _timed_http_request(pool, the_url, method, authorization, kw, max_body_size, parser, timing, timeout)
+    http_method, http_url, http_body, headers = _prepare_request(the_url, method, authorization, kw)
+    resp = pool.urlopen(http_method, http_url, http_body, headers, timeout=timeout)
+    try:
+        body = _read_body(resp, max_body_size, inflate=_inflate_in_thread(resp, parser))
+    finally:
+        resp.close()
+    return _parse_response(http_url, resp, body, parser, max_body_size=max_body_size)
+
+
+def _timed_http_request(pool, the_url, method, authorization, kw, max_body_size, parser, timing, timeout):
+    start = time.perf_counter()
+    try:
+        http_method, http_url, http_body, headers = _prepare_request(the_url, method, authorization, kw)
+        timing.method = http_method
+        resp = pool.urlopen(http_method, http_url, http_body, headers, timeout=timeout, timing=timing)
+        timing.status = resp.status
+        try:
+            body = _read_body(resp, max_body_size, timing, _inflate_in_thread(resp, parser))
+        finally:
+            resp.close()
+        return _parse_response(http_url, resp, body, parser, timing, max_body_size)
+    except APIError as e:
+        timing.error_code = str(e.error_code)
+        raise
+    except Exception as e:
+        timing.error_code = e.__class__.__name__
+        raise
+    finally:
+        timing.total = time.perf_counter() - start
+
+
+def _prepare_request(the_url, method, authorization, kw):
+    """
+    return (http_method, url, body, headers) of an api call.
+    """
     boundary = None
+    prepared = getattr(kw, 'prepared', None)
     if method == _HTTP_UPLOAD:
+        if prepared is not None:
+            # a multipart body cannot be prepared, the static parameters are encoded with the others:
+            kw = dict(prepared.params, **kw)
         params, boundary = _encode_multipart(**kw)
     else:
         params = _encode_params(**kw)
         if '/remind/' in the_url:
             # fix sina remind api:
             the_url = the_url.replace('https://api.', 'https://rm.api.')
-    http_url = '%s?%s' % (the_url, params) if method == _HTTP_GET else the_url
-    http_body = None if method == _HTTP_GET else params.encode()
-    req = Request(http_url, data=http_body)
-    req.add_header('Accept-Encoding', 'gzip')
+    http_body = None
+    if method == _HTTP_GET:
+        if prepared is not None:
+            # static parameters of a prepared request are encoded already:
+            params = '&'.join(p for p in (prepared.query, params) if p)
+        http_url = '%s?%s' % (the_url, params)
+    else:
+        http_url = the_url
+        if method == _HTTP_UPLOAD:
+            http_body = params
+        elif prepared is not None:
+            http_body = b'&'.join(p for p in (prepared.body, params.encode()) if p)
+        else:
+            http_body = params.encode()
+    headers = {'Accept-Encoding': 'gzip'}
     if authorization:
-        req.add_header('Authorization', 'OAuth2 %s' % authorization)
+        headers['Authorization'] = prepared.authorization(authorization) if prepared is not None else 'OAuth2 %s' % authorization
     if boundary:
-        req.add_header('Content-Type', 'multipart/form-data; boundary=%s' % boundary)
-    try:
-        resp = urlopen(req, timeout=5)
-        body = _read_body(resp)
-        r = _parse_json(body)
-        if hasattr(r, 'error_code'):
-            raise APIError(r.error_code, r.get('error', ''), r.get('request', ''))
-        return r
-    except HTTPError as e:
+        headers['Content-Type'] = 'multipart/form-data; boundary=%s' % boundary
+    elif http_body is not None:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    if http_body is not None:
+        headers['Content-Length'] = str(len(http_body))
+    return 'GET' if method == _HTTP_GET else 'POST', http_url, http_body, headers
+
+
+def _inflate_in_thread(resp, parser):
+    # parsers like ProcessDecoder inflate gzip bodies themselves, error bodies are always parsed here:
+    return resp.status >= 400 or not getattr(parser, 'inflates', False)
+
+
+def _parse_response(http_url, resp, body, parser=_parse_json, timing=None, max_body_size=None):
+    """
+    parse the decoded response body, raise APIError or HTTPError if the call failed.
+    """
+    if resp.status >= 400:
         try:
-            r = _parse_json(_read_body(e))
+            r = _parse_json(body)
         except:
             r = None
         if hasattr(r, 'error_code'):
             raise APIError(r.error_code, r.get('error', ''), r.get('request', ''))
-        raise e
+        raise HTTPError(http_url, resp.status, resp.reason, resp.headers, BytesIO(body))
+    if max_body_size is not None and getattr(parser, 'inflates', False):
+        # the body is still compressed, the parser checks the size once it is inflated:
+        parser = functools.partial(parser, max_body_size=max_body_size)
+    if timing is None:
+        r = parser(body)
+    else:
+        start = time.perf_counter()
+        r = parser(body)
+        timing.parse = time.perf_counter() - start
+    if hasattr(r, 'error_code'):
+        raise APIError(r.error_code, r.get('error', ''), r.get('request', ''))
+    return r
+
+
+class _JsonStreamReader(object):
+    """
+    decode json values one by one from an iterable of utf-8 bytes chunks.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decode = codecs.getincrementaldecoder('utf-8')().decode
+        self._decoder = json.JSONDecoder(object_hook=JsonDict)
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            self._buf = self._buf[self._pos:] + self._decode(b'', True)
+        else:
+            self._buf = self._buf[self._pos:] + self._decode(chunk)
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """
+        return the next non-whitespace character, or '' at the end.
+        """
+        while True:
+            buf, pos = self._buf, self._pos
+            n = len(buf)
+            while pos < n and buf[pos] in ' \t\n\r':
+                pos += 1
+            self._pos = pos
+            if pos < n:
+                return buf[pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError('invalid json: expect %r but got %r' % (c, self.peek()))
+        self._pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                v, end = self._decoder.raw_decode(self._buf, self._pos)
+                # a number at the end of the buffer may go on in the next chunk, even after '1' of '1e3':
+                if self._eof or (end < len(self._buf) and not (
+                        isinstance(v, (int, float)) and self._buf[end] in '.eE+-')):
+                    self._pos = end
+                    return v
+            except ValueError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def array(self):
+        """
+        yield the elements of an array.
+        """
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            c = self.peek()
+            self._pos += 1
+            if c == ']':
+                return
+            if c != ',':
+                raise ValueError('invalid json: expect \',\' or \']\' but got %r' % c)
+
+
+def _stream_list(chunks, fields, envelope):
+    """
+    yield (field, item) of the list fields of a json object as soon as each item is decoded,
+    and put the other fields into envelope. items of a top level list have field None.
+
+    >>> envelope = {}
+    >>> list(_stream_list([b'{"ids": [1, 2', b'3], "next_cur', b'sor": 5}'], ('ids',), envelope)), envelope
+    ([('ids', 1), ('ids', 23)], {'next_cursor': 5})
+    >>> list(_stream_list([b'{"ids":[1e', b'3, 2.', b'5]}'], ('ids',), {}))
+    [('ids', 1000.0), ('ids', 2.5)]
+    """
+    reader = _JsonStreamReader(chunks)
+    if reader.peek() == '[':
+        for item in reader.array():
+            yield None, item
+        return
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key in fields and reader.peek() == '[':
+            for item in reader.array():
+                yield key, item
+        else:
+            envelope[key] = reader.value()
+        c = reader.peek()
+        reader._pos += 1
+        if c == '}':
+            return
+        if c != ',':
+            raise ValueError('invalid json: expect \',\' or \'}\' but got %r' % c)
+
+
+class ListStream(object):
+    """
+    iterator over the items of a list response while the response is still being received,
+    returned by APIClient.stream(). the other fields like next_cursor are in envelope
+    once the iteration is done, and field is the name of the list like 'statuses'.
+    the connection is released when the stream is closed or garbage collected.
+    """
+    def __init__(self, resp, fields, max_body_size=None):
+        self.field = None
+        self.envelope = JsonDict()
+        self._items = _stream_list(_iter_body(resp, max_body_size), fields, self.envelope)
+        self._release = weakref.finalize(self, resp.close)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            self.field, item = next(self._items)
+            return item
+        except StopIteration:
+            self.close()
+            if 'error_code' in self.envelope:
+                r = self.envelope
+                raise APIError(r.error_code, r.get('error', ''), r.get('request', ''))
+            raise
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        """
+        stop reading, the connection is not reused if the response is not read to the end.
+        """
+        self._items.close()
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _request_key(path, kw, access_token):
+    """
+    return a key which identifies a GET call.
+
+    >>> _request_key('users/show', dict(uid=1, screen_name='x'), 'abc')
+    'users/show?screen_name=x&uid=1#abc'
+    """
+    params = _encode_params(**dict(sorted(kw.items())))
+    prepared = getattr(kw, 'prepared', None)
+    if prepared is not None:
+        params = '&'.join(p for p in (prepared.query, params) if p)
+    return '%s?%s#%s' % (path, params, access_token or '')
+
+
+class RequestTiming(object):
+    """
+    phases of one api request in seconds, given to the report() method of the client metrics.
+
+    connect and tls are only measured for new connections, reused is True if a pooled one was used.
+    error_code is the api error code or the exception class name if the request failed.
+    """
+    __slots__ = ('path', 'method', 'status', 'error_code', 'reused',
+                 'connect', 'tls', 'ttfb', 'body', 'gunzip', 'parse', 'total')
+
+    PHASES = ('connect', 'tls', 'ttfb', 'body', 'gunzip', 'parse', 'total')
+
+    def __init__(self, path, method=None):
+        self.path = path
+        self.method = method
+        self.status = None
+        self.error_code = None
+        self.reused = False
+        self.connect = self.tls = self.ttfb = self.body = self.gunzip = self.parse = self.total = 0.0
+
+    def __repr__(self):
+        return 'RequestTiming(%s %s, status=%s, error_code=%s, %s)' % (
+            self.method, self.path, self.status, self.error_code,
+            ', '.join('%s=%.2fms' % (p, getattr(self, p) * 1000.0) for p in self.PHASES))
+
+
+# upper bounds of histogram buckets from 0.1 ms to about 10 min, each 25% wider than the previous one:
+_HISTOGRAM_BOUNDS = [0.0001 * 1.25 ** i for i in range(71)]
+
+
+class _Histogram(object):
+    """
+    fixed-size histogram of durations, percentiles are estimated by bucket upper bounds.
+
+    >>> h = _Histogram()
+    >>> for i in range(1, 101):
+    ...     h.add(i / 1000.0)
+    >>> h.count, round(h.max, 3)
+    (100, 0.1)
+    >>> 0.045 <= h.percentile(0.5) <= 0.0625, 0.09 <= h.percentile(0.99) <= 0.1
+    (True, True)
+    """
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(_HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(_HISTOGRAM_BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        rank = p * self.count
+        n = 0
+        for i, c in enumerate(self.counts):
+            n += c
+            if n >= rank and c:
+                return min(self.max, _HISTOGRAM_BOUNDS[i]) if i < len(_HISTOGRAM_BOUNDS) else self.max
+        return 0.0
+
+    def stats(self):
+        return dict(count=self.count,
+                    mean=self.sum / self.count if self.count else 0.0,
+                    p50=self.percentile(0.5),
+                    p90=self.percentile(0.9),
+                    p99=self.percentile(0.99),
+                    max=self.max)
+
+
+class HistogramMetrics(object):
+    """
+    aggregate request timings in memory as histograms per (method, path):
+
+        metrics = HistogramMetrics()
+        client = APIClient(app_key, app_secret, metrics=metrics)
+        ...
+        for method, path, p99 in metrics.slowest(5):
+            print(method, path, p99)
+
+    any object with a report(timing) method can be used as metrics of a client,
+    which calls it with a RequestTiming after every request. the default None records nothing.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def report(self, timing):
+        key = (timing.method, timing.path)
+        with self._lock:
+            e = self._endpoints.get(key)
+            if e is None:
+                e = self._endpoints[key] = dict(count=0, errors={}, statuses={},
+                                                phases=dict((p, _Histogram()) for p in RequestTiming.PHASES))
+            e['count'] += 1
+            e['statuses'][timing.status] = e['statuses'].get(timing.status, 0) + 1
+            if timing.error_code is not None:
+                e['errors'][timing.error_code] = e['errors'].get(timing.error_code, 0) + 1
+            phases = e['phases']
+            for p in RequestTiming.PHASES:
+                if timing.reused and (p == 'connect' or p == 'tls'):
+                    continue
+                phases[p].add(getattr(timing, p))
+
+    def stats(self):
+        """
+        return dict of (method, path) -> dict(count, errors, statuses, and phase -> dict(count, mean, p50, p90, p99, max)).
+        """
+        with self._lock:
+            r = {}
+            for key, e in self._endpoints.items():
+                s = dict(count=e['count'], errors=dict(e['errors']), statuses=dict(e['statuses']))
+                for p, h in e['phases'].items():
+                    s[p] = h.stats()
+                r[key] = s
+            return r
+
+    def slowest(self, n=10, phase='total', percentile=0.99):
+        """
+        return the n slowest endpoints as a list of (method, path, seconds) by the percentile of a phase.
+        """
+        with self._lock:
+            r = [(m, path, e['phases'][phase].percentile(percentile)) for (m, path), e in self._endpoints.items()]
+        r.sort(key=lambda x: x[2], reverse=True)
+        return r[:n]
+
+    def clear(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+# api errors meaning the requested object does not exist, which are cached like responses:
+_NOT_FOUND_ERRORS = frozenset(['20003', '20101'])
+
+# default cache ttl in seconds of idempotent endpoints:
+_DEFAULT_CACHE_TTLS = {
+    'users/show': 300,
+    'users/domain_show': 300,
+    'statuses/show': 60,
+    'emotions': 3600,
+}
+
+
+class MemoryCacheStore(object):
+    """
+    thread-safe in-process LRU store of at most maxsize entries. it can be shared by many clients.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileCacheStore(object):
+    """
+    store entries as pickle files in a directory which can be shared by worker processes.
+    the least recently written files are removed when there are more than maxsize.
+    """
+    def __init__(self, directory, maxsize=10000):
+        self.directory = directory
+        self.maxsize = maxsize
+        self._writes = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, entry):
+        path = self._path(key)
+        tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune()
+
+    def _prune(self):
+        files = [e for e in os.scandir(self.directory) if e.is_file() and not e.name.endswith('.tmp')]
+        if len(files) > self.maxsize:
+            files.sort(key=lambda e: e.stat().st_mtime)
+            for e in files[:len(files) - self.maxsize]:
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        for e in os.scandir(self.directory):
+            os.remove(e.path)
+
+
+class ResponseCache(object):
+    """
+    cache of GET responses keyed by path, parameters and access token.
+
+    only endpoints in ttls are cached, for ttls[path] seconds. errors telling that a user or status
+    does not exist are cached for negative_ttl seconds. cached objects are shared, do not modify them.
+
+        client = APIClient(APP_KEY, APP_SECRET, cache=ResponseCache(ttls={'users/show': 300}))
+    """
+    def __init__(self, ttls=None, negative_ttl=60, store=None):
+        self.ttls = dict(_DEFAULT_CACHE_TTLS if ttls is None else ttls)
+        self.negative_ttl = negative_ttl
+        self.store = store or MemoryCacheStore()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, path, kw, access_token, func):
+        """
+        return the cached response of the GET call, or call func() and cache its result.
+        """
+        ttl = self.ttls.get(path)
+        if not ttl:
+            return func()
+        key = _request_key(path, kw, access_token)
+        entry = self.store.get(key)
+        now = time.time()
+        if entry is not None and entry[0] > now:
+            with self._lock:
+                self.hits += 1
+            expires, value, error = entry
+            if error:
+                raise APIError(*value)
+            return value
+        with self._lock:
+            self.misses += 1
+        try:
+            r = func()
+        except APIError as e:
+            if self.negative_ttl and str(e.error_code) in _NOT_FOUND_ERRORS:
+                self.store.set(key, (now + self.negative_ttl, (e.error_code, e.error, e.request), True))
+            raise
+        self.store.set(key, (now + ttl, r, False))
+        return r
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    coalesce identical GET calls in flight: while a call of the same path, parameters
+    and token is running, other callers wait for it and share its result or APIError.
+    one instance can be shared by many clients.
+
+    >>> flights = SingleFlight()
+    >>> started, release = threading.Event(), threading.Event()
+    >>> def slow_call():
+    ...     started.set()
+    ...     release.wait()
+    ...     return 'result'
+    >>> leader = threading.Thread(target=flights.fetch, args=('users/show', dict(uid=1), 'token', slow_call))
+    >>> leader.start(); started.wait()
+    True
+    >>> results = []
+    >>> follower = threading.Thread(target=lambda: results.append(
+    ...     flights.fetch('users/show', dict(uid=1), 'token', lambda: 'another call')))
+    >>> follower.start()
+    >>> while flights.stats()['shared'] == 0:
+    ...     time.sleep(0.001)
+    >>> release.set(); leader.join(); follower.join()
+    >>> results, flights.stats()
+    (['result'], {'calls': 2, 'shared': 1})
+    """
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def fetch(self, path, kw, access_token, func):
+        key = _request_key(path, kw, access_token)
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.shared += 1
+        if not leader:
+            flight.event.wait()
+            e = flight.error
+            if e is not None:
+                if isinstance(e, APIError):
+                    raise APIError(e.error_code, e.error, e.request)
+                raise e
+            return flight.result
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    def stats(self):
+        return dict(calls=self.calls, shared=self.shared)
+
+
+# api errors telling that the ip (app) or the user is out of rate limit:
+_IP_RATE_LIMIT_ERRORS = frozenset(['10022'])
+_USER_RATE_LIMIT_ERRORS = frozenset(['10023', '10024'])
+
+
+class _TokenBucket(object):
+    """
+    token bucket refilled with limit tokens every period seconds. must be used with a lock held.
+
+    once the server quota is known by reset(), the bucket holds only the remaining hits and gets
+    no tokens before the quota is reset, then limit tokens at every reset like the server:
+
+    >>> b = _TokenBucket(150, 3600)
+    >>> b.reset(5, 150, 60, 3600, now=0.0)
+    >>> n = 0
+    >>> while b.wait_time(30.0) <= 0.0:
+    ...     b.tokens -= 1.0
+    ...     n += 1
+    >>> n, b.wait_time(30.0)
+    (5, 30.0)
+    >>> b.wait_time(60.0), b.tokens
+    (0.0, 150.0)
+    """
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.rate = float(limit) / period
+        self.tokens = float(limit)
+        self.updated = time.time()
+        self.reset_at = None
+
+    def _refill(self, now):
+        if self.reset_at is not None:
+            if now >= self.reset_at:
+                self.tokens = float(self.limit)
+                # the server quota is reset every period from then on:
+                self.reset_at += self.period * (1 + int((now - self.reset_at) // self.period))
+            self.updated = now
+            return
+        self.tokens = min(self.limit, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        self._refill(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        if self.reset_at is not None:
+            return self.reset_at - now
+        return (1.0 - self.tokens) / self.rate
+
+    def reset(self, remaining, limit, reset_in, period, now=None):
+        self.limit = limit
+        self.period = period
+        self.rate = float(limit) / period
+        self.drain(reset_in, now)
+        self.tokens = float(max(remaining, 0))
+
+    def drain(self, reset_in, now=None):
+        now = time.time() if now is None else now
+        self.tokens = 0.0
+        self.updated = now
+        self.reset_at = now + reset_in
+
+
+class RateLimiter(object):
+    """
+    pace api calls with token buckets per access token and per app key, to stay under the
+    hourly quota instead of getting 10022/10023/10024 errors. the buckets start full, call
+    APIClient.seed_rate_limit() to load the real remaining hits from account/rate_limit_status.
+    if a call would wait more than max_wait seconds it fails at once with APIError.
+    """
+    def __init__(self, user_limit=150, app_limit=1000, period=3600.0, max_wait=None):
+        self.user_limit = user_limit
+        self.app_limit = app_limit
+        self.period = period
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, key):
+        # must be called with self._lock held:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _TokenBucket(self.user_limit if key[0] == 'user' else self.app_limit, self.period)
+        return bucket
+
+    def _keys(self, app_key, access_token):
+        return (('app', app_key), ('user', access_token)) if access_token else (('app', app_key),)
+
+    def acquire(self, app_key, access_token, deadline=None):
+        """
+        block until both the user and the app bucket have a token, and take them.
+        raise DeadlineExceeded at once if the wait would pass the deadline.
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                buckets = [self._bucket(k) for k in self._keys(app_key, access_token)]
+                waits = [b.wait_time(now) for b in buckets]
+                wait = max(waits)
+                if wait <= 0.0:
+                    for b in buckets:
+                        b.tokens -= 1.0
+                    return
+            if self.max_wait is not None and wait > self.max_wait:
+                if waits.index(wait) == 0:
+                    raise APIError('10022', 'IP requests out of rate limit', 'rate limiter')
+                raise APIError('10023', 'User requests out of rate limit', 'rate limiter')
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded('deadline exceeded while waiting for rate limit')
+            time.sleep(wait)
+
+    def seed(self, app_key, access_token, status):
+        """
+        reset buckets with the result of account/rate_limit_status.
+
+        >>> limiter = RateLimiter(max_wait=1.0)
+        >>> limiter.seed('app', 'token', dict(remaining_ip_hits=1000, ip_limit=1000, remaining_user_hits=2,
+        ...                                   user_limit=150, reset_time_in_seconds=60))
+        >>> limiter.remaining('app', 'token')
+        {'app': 1000, 'user': 2}
+        >>> limiter.acquire('app', 'token'); limiter.acquire('app', 'token')
+        >>> try:
+        ...     limiter.acquire('app', 'token')
+        ... except APIError as e:
+        ...     print(e.error_code)
+        10023
+        """
+        reset_in = float(status.get('reset_time_in_seconds', self.period))
+        with self._lock:
+            self._bucket(('app', app_key)).reset(int(status['remaining_ip_hits']), int(status['ip_limit']), reset_in, self.period)
+            if access_token:
+                self._bucket(('user', access_token)).reset(int(status['remaining_user_hits']), int(status['user_limit']), reset_in, self.period)
+
+    def on_error(self, app_key, access_token, e):
+        """
+        drain the bucket which the server says is out of rate limit.
+        """
+        code = str(e.error_code)
+        if code in _IP_RATE_LIMIT_ERRORS:
+            key = ('app', app_key)
+        elif code in _USER_RATE_LIMIT_ERRORS and access_token:
+            key = ('user', access_token)
+        else:
+            return
+        with self._lock:
+            bucket = self._bucket(key)
+            # the quota is reset every hour:
+            bucket.drain(self.period - time.time() % self.period)
+
+    def remaining(self, app_key, access_token=None):
+        """
+        return the number of calls which can be sent now as dict(app=..., user=...).
+        """
+        with self._lock:
+            now = time.time()
+            r = {}
+            for k in self._keys(app_key, access_token):
+                b = self._bucket(k)
+                b._refill(now)
+                r[k[0]] = max(0, int(b.tokens))
+            return r
+
+
+# api errors telling that the server is busy, which are worth a retry:
+_RETRY_ERRORS = frozenset(['10001', '10002', '10009'])
+
+
+class RetryPolicy(object):
+    """
+    retry failed calls with exponential backoff and full jitter.
+
+    GETs are retried on connection errors, timeouts, 5xx responses and the 'system busy'
+    api errors, POSTs only if retry_post is True. no retry is started after deadline seconds.
+    if hedge is True a second GET is sent when the first one takes longer than the
+    hedge_percentile latency of recent calls, and the first successful response wins.
+    both are sent from threads of their own while the calling thread waits:
+
+    >>> policy = RetryPolicy(hedge=True)
+    >>> policy._latencies.extend([0.01] * 20)
+    >>> calls = []
+    >>> def fetch():
+    ...     calls.append(None)
+    ...     time.sleep(1.0 if len(calls) == 1 else 0.01)
+    ...     return 'response %d' % len(calls)
+    >>> start = time.time()
+    >>> policy.call(fetch, _HTTP_GET), time.time() - start < 0.5
+    ('response 2', True)
+    """
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=10.0, deadline=30.0, retry_post=False,
+                 hedge=False, hedge_percentile=0.95, min_hedge_delay=0.05):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.retry_post = retry_post
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self._latencies = collections.deque(maxlen=200)
+
+    def is_retryable(self, e):
+        """
+        return True if a call which failed with e may succeed when it is sent again.
+
+        >>> policy = RetryPolicy()
+        >>> policy.is_retryable(ConnectionResetError()), policy.is_retryable(ssl.SSLCertVerificationError())
+        (True, False)
+        """
+        if isinstance(e, APIError):
+            return str(e.error_code) in _RETRY_ERRORS
+        if isinstance(e, HTTPError):
+            return e.code >= 500
+        if isinstance(e, (DeadlineExceeded, ssl.CertificateError)):
+            # a certificate which cannot be verified will not be verified by the next attempt either:
+            return False
+        return isinstance(e, (OSError, http.client.BadStatusLine, http.client.IncompleteRead))
+
+    def backoff_delay(self, attempt):
+        """
+        return a random delay before the attempt-th retry.
+
+        >>> 0.0 <= RetryPolicy(backoff=1.0).backoff_delay(3) <= 8.0
+        True
+        """
+        return random.uniform(0.0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def call(self, func, method, deadline=None):
+        """
+        call func() until it succeeds, fails with an error not worth a retry or runs out of attempts.
+        no retry is started if it cannot begin before deadline, an absolute time.time() of the call.
+        """
+        if method != _HTTP_GET and not self.retry_post:
+            return func()
+        if self.deadline:
+            deadline = min(deadline or float('inf'), time.time() + self.deadline)
+        attempt = 0
+        while True:
+            try:
+                if self.hedge and method == _HTTP_GET:
+                    return self._hedged(func)
+                return self._timed(func)
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.max_attempts or not self.is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt - 1)
+                if deadline is not None and time.time() + delay >= deadline:
+                    raise
+                logging.info('retry in %.2fs after error: %s', delay, e)
+                time.sleep(delay)
+
+    def _timed(self, func):
+        start = time.time()
+        r = func()
+        self._latencies.append(time.time() - start)
+        return r
+
+    def hedge_delay(self):
+        latencies = sorted(self._latencies)
+        if len(latencies) < 10:
+            return None
+        return max(self.min_hedge_delay, latencies[int(len(latencies) * self.hedge_percentile) - 1])
+
+    def _hedged(self, func):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(func)
+        outcomes = queue.Queue()
+
+        def _send():
+            try:
+                outcomes.put((True, self._timed(func)))
+            except Exception as e:
+                outcomes.put((False, e))
+
+        def _start():
+            t = threading.Thread(target=_send, name='weibo-hedged-request')
+            t.daemon = True
+            t.start()
+        _start()
+        try:
+            ok, r = outcomes.get(timeout=delay)
+        except queue.Empty:
+            _start()
+            ok, r = outcomes.get()
+            if not ok:
+                # the first one has failed, wait for the other one:
+                ok, r = outcomes.get()
+        if ok:
+            return r
+        raise r
 
 
 class HttpObject(object):
@@ -193,26 +1593,52 @@ class HttpObject(object):
         self.method = method
 
     def __getattr__(self, attr):
+        path = attr.replace('__', '/')
+
         def wrap(**kw):
-            if self.client.is_expires():
-                raise APIError('21327', 'expired_token', attr)
-            return _http_call('%s%s.json' % (self.client.api_url, attr.replace('__', '/')), self.method, self.client.access_token, **kw)
+            self.client._check_token(self.method, path, attr)
+            deadline = kw.pop('deadline', None)
+            return self.client._call(self.method, path, kw, deadline)
+        if not attr.startswith('_'):
+            # memoize, __getattr__ is not called again for this attr:
+            self.__dict__[attr] = wrap
         return wrap
 
 
 class APIClient(object):
     """
     API client using synchronized invocation.
+
+    requests time out after timeout seconds, or timeouts[path] for the endpoints in timeouts.
+    every call also takes an absolute deadline like time.time() + 1.5, which bounds
+    the timeout, the retries and the wait for rate limit of the call. a call which
+    cannot be sent before its deadline raises DeadlineExceeded:
+
+        r = client.remind.unread_count.get(uid=123, deadline=time.time() + 1.0)
     """
-    def __init__(self, app_key, app_secret, redirect_uri=None, response_type='code', domain='api.weibo.com', version='2'):
+    def __init__(self, app_key, app_secret, redirect_uri=None, response_type='code', domain='api.weibo.com', version='2', pool=None, max_body_size=None, parser=None, cache=None, rate_limiter=None, retry=None, single_flight=None, metrics=None, timeout=5.0, timeouts=None):
         self.client_id = str(app_key)
         self.client_secret = str(app_secret)
         self.redirect_uri = redirect_uri
         self.response_type = response_type
         self.auth_url = 'https://%s/oauth2/' % domain
         self.api_url = 'https://%s/%s/' % (domain, version)
-        self.access_token = None
-        self.expires = 0.0
+        # (access_token, expires) is kept in one tuple so that a refreshed token is swapped in atomically:
+        self._token = (None, 0.0)
+        self.pool = pool or _default_pool
+        self.max_body_size = max_body_size
+        self.parser = parser or _parse_json
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.single_flight = single_flight
+        self.metrics = metrics
+        self.timeout = timeout
+        self.timeouts = dict(_DEFAULT_TIMEOUTS if timeouts is None else timeouts)
+        self._urls = {}
+        self._endpoints = {}
+        self._loaders = {}
+        self._loaders_lock = threading.Lock()
         self.get = HttpObject(self, _HTTP_GET)
         self.post = HttpObject(self, _HTTP_POST)
         self.upload = HttpObject(self, _HTTP_UPLOAD)
@@ -230,7 +1656,7 @@ class APIClient(object):
             return s.replace('-', '+').replace('_', '/') + appendix
 
         sr = str(signed_request)
-        logging.info('parse signed request: %s' % sr)
+        logging.info('parse signed request: %s', sr)
         enc_sig, enc_payload = sr.split('.', 1)
         sig = base64.b64decode(_b64_normalize(enc_sig))
         data = _parse_json(base64.b64decode(_b64_normalize(enc_payload)))
@@ -246,11 +1672,33 @@ class APIClient(object):
             return data
         return None
 
+    @property
+    def access_token(self):
+        return self._token[0]
+
+    @access_token.setter
+    def access_token(self, access_token):
+        self._token = (access_token, self._token[1])
+
+    @property
+    def expires(self):
+        return self._token[1]
+
+    @expires.setter
+    def expires(self, expires):
+        self._token = (self._token[0], expires)
+
     def set_access_token(self, access_token, expires):
-        self.access_token = str(access_token)
-        self.expires = float(expires)
+        self._token = (str(access_token), float(expires))
 
-    def get_authorize_url(self, redirect_uri=None, **kw):
+    def _replace_token(self, old_token, access_token, expires):
+        """
+        swap in a refreshed token if old_token is the current one.
+        """
+        if old_token is None or old_token == self.access_token:
+            self.set_access_token(access_token, expires)
+
+    def get_authorize_url(self, redirect_uri=None, **kw):
         """
         return the authorization url that the user should be redirected to.
         """
@@ -274,7 +1722,8 @@ class APIClient(object):
             rtime = int(remind_in) + current
             if rtime < expires:
                 expires = rtime
-        return JsonDict(access_token=r.access_token, expires=expires, expires_in=expires, uid=r.get('uid', None))
+        return JsonDict(access_token=r.access_token, expires=expires, expires_in=expires, uid=r.get('uid', None),
+                        refresh_token=r.get('refresh_token', None))
 
     def request_access_token(self, code, redirect_uri=None):
         redirect = redirect_uri if redirect_uri else self.redirect_uri
@@ -298,12 +1747,1355 @@ class APIClient(object):
         return self._parse_access_token(r)
 
     def is_expires(self):
-        return not self.access_token or time.time() > self.expires
+        access_token, expires = self._token
+        return not access_token or time.time() > expires
+
+    def _check_token(self, method, path, request):
+        if self.is_expires():
+            raise APIError('21327', 'expired_token', request)
+
+    def endpoint(self, path, method='GET'):
+        """
+        return a cached handle of an api endpoint, which is faster to call in a loop
+        than building the attribute chain every time:
+
+            user_timeline = client.endpoint('statuses/user_timeline')
+            for uid in uids:
+                r = user_timeline(uid=uid)
+        """
+        key = (path, method)
+        ep = self._endpoints.get(key)
+        if ep is None:
+            ep = self._endpoints[key] = _Executable(self, method, path)
+        return ep
+
+    def prepare(self, path, method='GET', **static_params):
+        """
+        return a prepared request of an endpoint with static parameters encoded once,
+        only the parameters given at call time are encoded for every call:
+
+            timeline = client.prepare('statuses/user_timeline', count=200, trim_user=1, feature=1)
+            for uid in uids:
+                r = timeline(uid=uid)
+
+        a parameter given at call time overrides the static one:
+
+        >>> client = APIClient('key', 'secret')
+        >>> client._call = lambda method, path, kw, deadline=None: _prepare_request(client._api_url(path), method, 'token', kw)[1]
+        >>> timeline = client.prepare('statuses/user_timeline', count=200)
+        >>> timeline(uid=123)
+        'https://api.weibo.com/2/statuses/user_timeline.json?count=200&uid=123'
+        >>> timeline(uid=123, count=50)
+        'https://api.weibo.com/2/statuses/user_timeline.json?count=50&uid=123'
+        """
+        return _PreparedRequest(self, method, path, static_params)
+
+    def loader(self, path, **params):
+        """
+        return the BatchLoader of a single id endpoint like 'users/show' or 'statuses/show',
+        shared by all callers asking for the same path and parameters:
+
+            futures = [client.loader('users/show').load(uid) for uid in uids]
+            users = [f.result() for f in futures]
+        """
+        key = (path, tuple(sorted(params.items())))
+        with self._loaders_lock:
+            loader = self._loaders.get(key)
+            if loader is None:
+                loader = self._loaders[key] = BatchLoader(self, path, **params)
+        return loader
+
+    def _api_url(self, path):
+        url = self._urls.get(path)
+        if url is None:
+            url = self._urls[path] = '%s%s.json' % (self.api_url, path)
+        return url
+
+    def execute_many(self, calls, max_workers=8):
+        """
+        run many api calls concurrently and return their results in order.
+        calls is a list of (executable, kw) tuples like (client.users.show.get, dict(uid=123)).
+        a call that fails, with APIError, HTTPError, a socket timeout or DeadlineExceeded,
+        puts the exception in its place instead of aborting the others.
+        """
+        def _run(call):
+            fn, kw = call
+            try:
+                return fn(**kw)
+            except Exception as e:
+                return e
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_run, calls))
+
+    def batch(self, max_workers=8):
+        """
+        return a context that collects api calls and runs them with execute_many() on exit:
+
+            with client.batch() as b:
+                for uid in uids:
+                    b.add(client.users.show.get, uid=uid)
+            users = b.results
+        """
+        return _Batch(self, max_workers)
+
+    def iterate(self, path, prefetch=False, max_pages=None, deadline=None, **kw):
+        """
+        yield items of a paged GET endpoint like 'statuses/user_timeline' or 'friendships/friends' page by page.
+
+        timelines are paged by max_id, favorites by page, user and id lists by next_cursor.
+        a response which is a list like 'emotions' has only one page. items repeated on
+        the boundary of two pages are skipped. if prefetch is True the next page is fetched
+        in background while the items of the current page are consumed. a page which
+        cannot be fetched before deadline raises DeadlineExceeded or a socket timeout.
+
+            for st in client.iterate('statuses/user_timeline', uid=123, count=100):
+                print(st.text)
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if prefetch else None
+        params = dict(kw)
+        try:
+            r = self._call(_HTTP_GET, path, params, deadline)
+            pages = 1
+            seen = set()
+            while True:
+                items, next_params = _next_page(r, params)
+                if max_pages is not None and pages >= max_pages:
+                    next_params = None
+                future = None
+                if next_params is not None and executor is not None:
+                    future = executor.submit(self._call, _HTTP_GET, path, next_params, deadline)
+                page_ids = set()
+                for item in items:
+                    item_id = _item_id(item)
+                    page_ids.add(item_id)
+                    if item_id not in seen:
+                        yield item
+                if next_params is None or not (page_ids - seen):
+                    break
+                seen = page_ids
+                params = next_params
+                r = future.result() if future is not None else self._call(_HTTP_GET, path, params, deadline)
+                pages += 1
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def stream(self, path, **kw):
+        """
+        send a GET and return a ListStream which yields the items of the 'statuses', 'comments',
+        'users' or 'ids' list while the response is received. cache, single flight and
+        retry are not applied:
+
+            s = client.stream('statuses/home_timeline', count=200)
+            for st in s:
+                print(st.text)
+            next_cursor = s.envelope.get('next_cursor')
+        """
+        deadline = kw.pop('deadline', None)
+        access_token = self.access_token
+        timeout = self._timeout(path, deadline)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(self.client_id, access_token, deadline)
+        http_method, http_url, http_body, headers = _prepare_request(self._api_url(path), _HTTP_GET, access_token, kw)
+        resp = self.pool.urlopen(http_method, http_url, http_body, headers, timeout=timeout)
+        if resp.status >= 400:
+            try:
+                body = _read_body(resp, self.max_body_size)
+            finally:
+                resp.close()
+            try:
+                _parse_response(http_url, resp, body)
+            except APIError as e:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_error(self.client_id, access_token, e)
+                raise
+        return ListStream(resp, tuple(field for field, _ in _PAGED_FIELDS), self.max_body_size)
+
+    def _call(self, method, path, kw, deadline=None):
+        if method != _HTTP_GET:
+            return self._request(method, path, kw, deadline)
+        fetch = lambda: self._request(method, path, kw, deadline)
+        if self.single_flight is not None:
+            fetch = functools.partial(self.single_flight.fetch, path, kw, self.access_token, fetch)
+        if self.cache is not None:
+            return self.cache.fetch(path, kw, self.access_token, fetch)
+        return fetch()
+
+    def seed_rate_limit(self):
+        """
+        load the remaining hits of the app and the current token from account/rate_limit_status into the rate limiter.
+        """
+        r = _http_request(self.pool, '%saccount/rate_limit_status.json' % self.api_url, _HTTP_GET, self.access_token, {},
+                          self.max_body_size, timeout=self.timeout)
+        self.rate_limiter.seed(self.client_id, self.access_token, r)
+        return r
+
+    def rate_limit_remaining(self):
+        """
+        return the calls which can be sent now without waiting, as dict(app=..., user=...).
+        """
+        return self.rate_limiter.remaining(self.client_id, self.access_token)
+
+    def _request(self, method, path, kw, deadline=None):
+        if self.retry is None:
+            return self._send(method, path, kw, deadline)
+        if method == _HTTP_UPLOAD:
+            # rewind files for every attempt:
+            files = [(v, v.tell()) for v in kw.values() if hasattr(v, 'read') and hasattr(v, 'seek')]
+
+            def _send():
+                for f, pos in files:
+                    f.seek(pos)
+                return self._send(method, path, kw, deadline)
+            return self.retry.call(_send, method, deadline)
+        return self.retry.call(lambda: self._send(method, path, kw, deadline), method, deadline)
+
+    def _send(self, method, path, kw, deadline=None):
+        return self._send_as(self.access_token, method, path, kw, deadline)
+
+    def _timeout(self, path, deadline):
+        """
+        return the socket timeout of a request, raise DeadlineExceeded if the deadline has passed.
+        """
+        timeout = self.timeouts.get(path, self.timeout)
+        if deadline is not None:
+            left = deadline - time.time()
+            if left <= 0.0:
+                raise DeadlineExceeded('deadline exceeded before sending request to %s' % path)
+            timeout = min(timeout, left)
+        return timeout
+
+    def _send_as(self, access_token, method, path, kw, deadline=None):
+        timeout = self._timeout(path, deadline)
+        timing = RequestTiming(path) if self.metrics is not None else None
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(self.client_id, access_token, deadline)
+            if deadline is not None:
+                timeout = self._timeout(path, deadline)
+        try:
+            return _http_request(self.pool, self._api_url(path), method, access_token, kw, self.max_body_size, self.parser, timing, timeout)
+        except APIError as e:
+            if self.rate_limiter is not None:
+                self.rate_limiter.on_error(self.client_id, access_token, e)
+            raise
+        finally:
+            if timing is not None:
+                self.metrics.report(timing)
 
     def __getattr__(self, attr):
         if '__' in attr:
             return getattr(self.get, attr)
-        return _Callable(self, attr)
+        c = _Callable(self, attr)
+        if not attr.startswith('_'):
+            self.__dict__[attr] = c
+        return c
+
+
+# list fields of paged responses, and the parameter which they are paged by:
+_PAGED_FIELDS = (
+    ('statuses', 'max_id'),
+    ('comments', 'max_id'),
+    ('reposts', 'max_id'),
+    ('favorites', 'page'),
+    ('users', 'cursor'),
+    ('ids', 'cursor'),
+)
+
+
+def _page_items(r):
+    """
+    return (items, paging) of a page, paging is None for a list which is not paged.
+
+    >>> _page_items(JsonDict(users=[1, 2], next_cursor=2))
+    ([1, 2], 'cursor')
+    """
+    if isinstance(r, list):
+        return r, None
+    for field, paging in _PAGED_FIELDS:
+        items = r.get(field)
+        if items is not None:
+            return items, paging
+    return [], None
+
+
+def _item_id(item):
+    if isinstance(item, int):
+        return item
+    item_id = item.get('id')
+    if item_id is None and 'status' in item:
+        # favorites are like {"status": {...}, "favorited_time": "..."}:
+        return item['status'].get('id')
+    return item_id
+
+
+def _next_page(r, params):
+    """
+    return (items, next_params) of a page, next_params is None if it is the last page.
+
+    >>> _next_page(JsonDict(statuses=[JsonDict(id=9), JsonDict(id=7)]), dict(count=2))
+    ([{'id': 9}, {'id': 7}], {'count': 2, 'max_id': 6})
+    >>> _next_page(JsonDict(ids=[1, 2], next_cursor=0), {})
+    ([1, 2], None)
+    >>> _next_page(JsonDict(favorites=[JsonDict(status=JsonDict(id=5))]), dict(page=2))[1]
+    {'page': 3}
+    >>> _next_page([JsonDict(phrase='[smile]')], {})[1] is None
+    True
+    """
+    items, paging = _page_items(r)
+    if not items or paging is None:
+        return items, None
+    next_params = dict(params)
+    if paging == 'cursor':
+        next_cursor = r.get('next_cursor', 0)
+        if not next_cursor:
+            return items, None
+        next_params['cursor'] = next_cursor
+    elif paging == 'page':
+        next_params['page'] = int(params.get('page', 1)) + 1
+    else:
+        next_params['max_id'] = int(_item_id(items[-1])) - 1
+    return items, next_params
+
+
+# GET endpoints which return data of the authorized user, that must not be called with another token:
+_USER_SPECIFIC_PREFIXES = (
+    'account/',
+    'remind/',
+    'favorites',
+    'direct_messages',
+    'suggestions/',
+    'friendships/groups',
+    'statuses/home_timeline',
+    'statuses/friends_timeline',
+    'statuses/bilateral_timeline',
+    'statuses/mentions',
+    'statuses/to_me',
+    'statuses/repost_by_me',
+    'comments/by_me',
+    'comments/to_me',
+    'comments/mentions',
+    'comments/timeline',
+)
+
+# api errors telling that a token cannot be used any more:
+_INVALID_TOKEN_ERRORS = frozenset(['21314', '21315', '21316', '21317', '21327', '21332'])
+
+
+class TokenPoolAPIClient(APIClient):
+    """
+    API client which spreads calls over many authorized tokens of the same app.
+
+    GETs which are not user-specific are sent with the least used token which is not expired,
+    POSTs and user-specific GETs are sent with the token of set_access_token(). tokens are
+    taken out of rotation on expired token errors, and until the next hour on rate limit errors.
+    set_access_token() is only needed for POSTs and user-specific GETs.
+
+        client = TokenPoolAPIClient(APP_KEY, APP_SECRET)
+        for token, expires in tokens:
+            client.add_token(token, expires)
+        client.users.show.get(uid=123)
+    """
+    def __init__(self, *args, **kw):
+        super(TokenPoolAPIClient, self).__init__(*args, **kw)
+        self._tokens = {}
+        self._tokens_lock = threading.Lock()
+
+    def add_token(self, access_token, expires):
+        with self._tokens_lock:
+            self._tokens[str(access_token)] = [float(expires), 0, 0.0]
+
+    def remove_token(self, access_token):
+        with self._tokens_lock:
+            self._tokens.pop(access_token, None)
+
+    def _replace_token(self, old_token, access_token, expires):
+        with self._tokens_lock:
+            entry = self._tokens.pop(old_token, None)
+            if entry is not None:
+                self._tokens[str(access_token)] = [float(expires), entry[1], 0.0]
+        super(TokenPoolAPIClient, self)._replace_token(old_token, access_token, expires)
+
+    def token_stats(self):
+        """
+        return dict of token -> dict(expires, used, parked_until).
+        """
+        with self._tokens_lock:
+            return dict((t, dict(expires=e, used=u, parked_until=p)) for t, (e, u, p) in self._tokens.items())
+
+    def _select_token(self):
+        now = time.time()
+        with self._tokens_lock:
+            best = None
+            for token, entry in self._tokens.items():
+                if entry[0] > now and entry[2] <= now and (best is None or entry[1] < best[1][1]):
+                    best = (token, entry)
+            if best is None:
+                if any(entry[0] > now for entry in self._tokens.values()):
+                    raise APIError('10023', 'User requests out of rate limit', 'no available token in pool')
+                raise APIError('21327', 'expired_token', 'no available token in pool')
+            best[1][1] += 1
+            return best[0]
+
+    def _token_failed(self, access_token, e):
+        """
+        take the token out of rotation if the error is caused by it, and return True if so.
+        """
+        code = str(e.error_code)
+        with self._tokens_lock:
+            entry = self._tokens.get(access_token)
+            if entry is None:
+                return False
+            if code in _INVALID_TOKEN_ERRORS:
+                del self._tokens[access_token]
+                return True
+            if code in _USER_RATE_LIMIT_ERRORS:
+                now = time.time()
+                entry[2] = now + 3600.0 - now % 3600.0
+                return True
+        return False
+
+    def _pooled(self, method, path):
+        return method == _HTTP_GET and not path.startswith(_USER_SPECIFIC_PREFIXES)
+
+    def _check_token(self, method, path, request):
+        # pooled calls do not need the token of set_access_token():
+        if not self._pooled(method, path):
+            super(TokenPoolAPIClient, self)._check_token(method, path, request)
+
+    def _send(self, method, path, kw, deadline=None):
+        if not self._pooled(method, path):
+            return self._send_as(self.access_token, method, path, kw, deadline)
+        while True:
+            access_token = self._select_token()
+            try:
+                return self._send_as(access_token, method, path, kw, deadline)
+            except APIError as e:
+                if not self._token_failed(access_token, e):
+                    raise
+
+
+class TokenRefresher(object):
+    """
+    refresh tokens of a client in a background thread margin seconds before they expire,
+    so that api calls never wait for OAuth:
+
+        r = client.request_access_token(code)
+        client.set_access_token(r.access_token, r.expires)
+        refresher = TokenRefresher(client)
+        refresher.track(r)
+        refresher.start()
+    """
+    def __init__(self, client, margin=600.0, interval=60.0):
+        self.client = client
+        self.margin = margin
+        self.interval = interval
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def track(self, r, refresh_token=None):
+        """
+        track a token returned by request_access_token() or refresh_token().
+        """
+        refresh_token = refresh_token or r.get('refresh_token')
+        if not refresh_token:
+            raise ValueError('refresh_token is required to refresh %s' % r.access_token)
+        with self._lock:
+            self._tokens[r.access_token] = (float(r.expires), refresh_token)
+
+    def untrack(self, access_token):
+        with self._lock:
+            self._tokens.pop(access_token, None)
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='weibo-token-refresher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def refresh_due(self):
+        """
+        refresh all tokens which expire within margin seconds, return the number of refreshed tokens.
+        """
+        due_time = time.time() + self.margin
+        with self._lock:
+            due = [(t, rt) for t, (expires, rt) in self._tokens.items() if expires <= due_time]
+        refreshed = 0
+        for old_token, refresh_token in due:
+            try:
+                r = self.client.refresh_token(refresh_token)
+            except Exception as e:
+                logging.warning('failed to refresh token %s...: %s', old_token[:6], e)
+                continue
+            with self._lock:
+                self._tokens.pop(old_token, None)
+                self._tokens[r.access_token] = (float(r.expires), r.get('refresh_token') or refresh_token)
+            self.client._replace_token(old_token, r.access_token, r.expires)
+            refreshed += 1
+        return refreshed
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.refresh_due()
+            self._stopped.wait(self.interval)
+
+
+class SqliteCheckpointStore(object):
+    """
+    keep checkpoints of TimelineSync in a sqlite database, which is in memory by default.
+
+    >>> store = SqliteCheckpointStore()
+    >>> store.set(('token', 'statuses/user_timeline', '123'), 1005, [(1001, 900)])
+    >>> store.get(('token', 'statuses/user_timeline', '123'))
+    (1005, [(1001, 900)])
+    """
+    def __init__(self, path=':memory:'):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('create table if not exists timeline_checkpoints ('
+                         'token text, endpoint text, uid text, since_id integer, gaps text, updated real, '
+                         'primary key (token, endpoint, uid))')
+        self._db.commit()
+
+    def get(self, key):
+        """
+        return (since_id, gaps) of a (token, endpoint, uid) key, or None if it was never synced.
+        """
+        with self._lock:
+            row = self._db.execute('select since_id, gaps from timeline_checkpoints where token=? and endpoint=? and uid=?', key).fetchone()
+        if row is None:
+            return None
+        return row[0], [tuple(g) for g in json.loads(row[1])]
+
+    def set(self, key, since_id, gaps):
+        with self._lock:
+            self._db.execute('insert or replace into timeline_checkpoints values (?, ?, ?, ?, ?, ?)',
+                             tuple(key) + (since_id, json.dumps(gaps), time.time()))
+            self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._db.execute('delete from timeline_checkpoints where token=? and endpoint=? and uid=?', key)
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class TimelineSync(object):
+    """
+    fetch only the statuses posted since the last sync of a timeline:
+
+        sync = TimelineSync(client, SqliteCheckpointStore('timelines.db'))
+        for st in sync.sync('statuses/user_timeline', uid=123):
+            save(st)
+
+    the newest id seen is kept as since_id for each (token, endpoint, uid). a run fetches at most
+    max_pages pages of count statuses; ranges it could not reach are kept as (max_id, since_id)
+    gaps and filled by the next runs. statuses are yielded newest first without duplicates, and
+    the checkpoint is saved after all statuses of a page are consumed, so a run which is
+    interrupted yields the statuses of the last page again next time.
+
+    >>> class FakeClient(object):
+    ...     access_token = 'token'
+    ...     ids = [1, 2, 3, 4, 5, 6, 7]
+    ...     def endpoint(self, path):
+    ...         def fetch(count, since_id=0, max_id=None, **kw):
+    ...             ids = [i for i in reversed(self.ids) if i > since_id and (max_id is None or i <= max_id)]
+    ...             return JsonDict(statuses=[JsonDict(id=i) for i in ids[:count]])
+    ...         return fetch
+    >>> client = FakeClient()
+    >>> sync = TimelineSync(client, count=2, max_pages=2)
+
+    the first run reaches only 4 statuses, the older ones are left as a gap:
+
+    >>> [st.id for st in sync.sync(uid=1)], sync.checkpoint(uid=1)
+    ([7, 6, 5, 4], (7, [(3, 0)]))
+
+    the next run fetches the new statuses first, then goes on with the gap:
+
+    >>> client.ids += [8, 9]
+    >>> [st.id for st in sync.sync(uid=1)], sync.checkpoint(uid=1)
+    ([9, 8, 3, 2], (9, [(1, 0)]))
+
+    a run interrupted in the middle of a page yields that page again:
+
+    >>> client.ids += [10, 11, 12]
+    >>> run = sync.sync(uid=1)
+    >>> next(run).id
+    12
+    >>> run.close()
+    >>> [st.id for st in sync.sync(uid=1)], sync.checkpoint(uid=1)
+    ([12, 11, 10], (12, [(1, 0)]))
+    >>> [st.id for st in sync.sync(uid=1)], sync.checkpoint(uid=1)
+    ([1], (12, []))
+    """
+    def __init__(self, client, store=None, count=100, max_pages=10):
+        self.client = client
+        self.store = store or SqliteCheckpointStore()
+        self.count = count
+        self.max_pages = max_pages
+
+    def _key(self, endpoint, uid):
+        # do not keep access tokens in the store:
+        token = hashlib.sha1((self.client.access_token or '').encode('utf-8')).hexdigest()
+        return token, endpoint, '' if uid is None else str(uid)
+
+    def checkpoint(self, endpoint='statuses/home_timeline', uid=None):
+        """
+        return (since_id, gaps) of a timeline, or None if it was never synced.
+        """
+        return self.store.get(self._key(endpoint, uid))
+
+    def reset(self, endpoint='statuses/home_timeline', uid=None):
+        self.store.delete(self._key(endpoint, uid))
+
+    def sync(self, endpoint='statuses/home_timeline', uid=None, **kw):
+        """
+        yield statuses of the timeline which were not yielded by previous syncs.
+        """
+        key = self._key(endpoint, uid)
+        since_id, gaps = self.store.get(key) or (0, [])
+        if uid is not None:
+            kw['uid'] = uid
+        fetch = self.client.endpoint(endpoint)
+        # ranges of ids still to fetch as (max_id, since_id), the new statuses first:
+        ranges = [(None, since_id)] + gaps
+        seen = set()
+        pages = 0
+        while ranges and pages < self.max_pages:
+            max_id, low = ranges[0]
+            params = dict(kw, count=self.count)
+            if low:
+                params['since_id'] = low
+            if max_id is not None:
+                params['max_id'] = max_id
+            statuses, _ = _page_items(fetch(**params))
+            pages += 1
+            ids = []
+            for st in statuses:
+                sid = int(_item_id(st))
+                if sid > low and (max_id is None or sid <= max_id) and sid not in seen:
+                    seen.add(sid)
+                    ids.append(sid)
+                    yield st
+            if max_id is None and ids:
+                since_id = max(since_id, max(ids))
+            if not ids or len(statuses) < self.count or min(ids) - 1 <= low:
+                # the range is done, a (low, low) range would be sent as max_id=low&since_id=low:
+                ranges.pop(0)
+            else:
+                ranges[0] = (min(ids) - 1, low)
+            self.store.set(key, since_id, [r for r in ranges if r[0] is not None])
+
+
+class _IdSet(object):
+    """
+    set of 64-bit ids in an open addressing array('q'), which takes 16 to 32 bytes per id
+    instead of about 60 bytes of a set of python ints.
+
+    >>> ids = _IdSet([3, 5])
+    >>> ids.add(5), ids.add(7), 5 in ids, 4 in ids, len(ids)
+    (False, True, True, False, 3)
+    """
+    _EMPTY = -2 ** 63
+
+    def __init__(self, ids=()):
+        self._table = array.array('q', [self._EMPTY]) * 8
+        self._mask = 7
+        self._len = 0
+        for i in ids:
+            self.add(i)
+
+    def __len__(self):
+        return self._len
+
+    def __contains__(self, x):
+        return self._table[self._slot(x)] == x
+
+    def _slot(self, x):
+        table, mask = self._table, self._mask
+        # fibonacci hashing spreads the sequential ids of weibo over the table:
+        i = ((x * 0x9E3779B97F4A7C15) >> 32) & mask
+        while True:
+            v = table[i]
+            if v == x or v == self._EMPTY:
+                return i
+            i = (i + 1) & mask
+
+    def add(self, x):
+        """
+        add id x, return True if it was not in the set.
+        """
+        i = self._slot(x)
+        if self._table[i] == x:
+            return False
+        self._insert(i, x)
+        return True
+
+    def _insert(self, i, x):
+        self._table[i] = x
+        self._len += 1
+        if self._len * 2 > len(self._table):
+            self._resize()
+
+    def _resize(self):
+        old = self._table
+        self._table = array.array('q', [self._EMPTY]) * (len(old) * 2)
+        self._mask = len(self._table) - 1
+        for v in old:
+            if v != self._EMPTY:
+                self._table[self._slot(v)] = v
+
+
+class _IdMap(_IdSet):
+    """
+    dict of 64-bit ids to 64-bit integers, with the values in a second array('q') next to the table of _IdSet.
+
+    >>> index = _IdMap()
+    >>> for i in range(20):
+    ...     index[1000 + i] = i
+    >>> index.get(1009), index.get(999), 1019 in index, len(index)
+    (9, None, True, 20)
+    """
+    def __init__(self):
+        _IdSet.__init__(self)
+        self._values = array.array('q', [0]) * len(self._table)
+
+    def get(self, x, default=None):
+        i = self._slot(x)
+        return self._values[i] if self._table[i] == x else default
+
+    def __setitem__(self, x, value):
+        i = self._slot(x)
+        self._values[i] = value
+        if self._table[i] != x:
+            self._insert(i, x)
+
+    def _resize(self):
+        table, values = self._table, self._values
+        self._table = array.array('q', [self._EMPTY]) * (len(table) * 2)
+        self._values = array.array('q', [0]) * len(self._table)
+        self._mask = len(self._table) - 1
+        for x, value in zip(table, values):
+            if x != self._EMPTY:
+                i = self._slot(x)
+                self._table[i] = x
+                self._values[i] = value
+
+
+class GraphCrawler(object):
+    """
+    crawl the follower or friend graph breadth-first from seed uids through friendships/followers/ids
+    or friendships/friends/ids, fetching the ids of many uids concurrently:
+
+        crawler = GraphCrawler(client, 'followers', max_depth=2, checkpoint_path='graph.ckpt')
+        crawler.crawl([1404376560])
+        for uid, ids in crawler.edges():
+            ...
+
+    ids are kept as 64-bit integers in one array('q') with an offset per crawled uid instead of
+    python ints in lists. the index of crawled uids and the set of uids seen so far are open
+    addressing tables of 64-bit integers too. if checkpoint_path is given, the state is saved
+    there every checkpoint_interval seconds and after each depth, and a new crawler with the
+    same path resumes it.
+    uids failing with APIError, like deleted users, are kept in errors and have no edges.
+    """
+    def __init__(self, client, relation='followers', max_depth=1, max_workers=8, count=5000, max_pages=None,
+                 checkpoint_path=None, checkpoint_interval=60.0):
+        self.client = client
+        self.path = 'friendships/%s/ids' % relation
+        self.max_depth = max_depth
+        self.max_workers = max_workers
+        self.count = count
+        self.max_pages = max_pages
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.errors = {}
+        self.depth = 0
+        self._nodes = array.array('q')
+        self._offsets = array.array('q')
+        self._edges = array.array('q')
+        self._index = _IdMap()
+        self._frontier = array.array('q')
+        self._next = array.array('q')
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self._load(checkpoint_path)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def neighbors(self, uid):
+        """
+        return the ids of a crawled uid as array('q'), or None if it is not crawled.
+        """
+        i = self._index.get(uid)
+        if i is None:
+            return None
+        end = self._offsets[i + 1] if i + 1 < len(self._offsets) else len(self._edges)
+        return self._edges[self._offsets[i]:end]
+
+    def edges(self):
+        """
+        yield (uid, ids) of all crawled uids.
+        """
+        for uid in self._nodes:
+            yield uid, self.neighbors(uid)
+
+    def stats(self):
+        return dict(nodes=len(self._nodes), edges=len(self._edges), errors=len(self.errors),
+                    depth=self.depth, frontier=len(self._frontier), next_frontier=len(self._next))
+
+    def crawl(self, seeds=None, max_nodes=None):
+        """
+        crawl from seeds, or continue the crawl resumed from the checkpoint, until max_depth
+        is done or max_nodes uids are crawled.
+        """
+        if seeds is not None and not self._frontier and not self._nodes:
+            self._frontier = array.array('q', seeds)
+        discovered = _IdSet(self._nodes)
+        for uid in self._frontier:
+            discovered.add(uid)
+        for uid in self._next:
+            discovered.add(uid)
+        saved = time.time()
+        chunk_size = self.max_workers * 4
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while self._frontier and self.depth <= self.max_depth:
+                frontier = self._frontier
+                for n in range(0, len(frontier), chunk_size):
+                    if max_nodes is not None and len(self._nodes) >= max_nodes:
+                        self._frontier = frontier[n:]
+                        self._save()
+                        return
+                    chunk = [uid for uid in frontier[n:n + chunk_size] if uid not in self._index]
+                    try:
+                        for uid, ids in zip(chunk, executor.map(self._fetch, chunk)):
+                            self._add(uid, ids)
+                            if self.depth < self.max_depth:
+                                for i in ids:
+                                    if discovered.add(i):
+                                        self._next.append(i)
+                    except BaseException:
+                        # keep what is crawled so far, uids of the chunk which are done are skipped on resume:
+                        self._frontier = frontier[n:]
+                        self._save()
+                        raise
+                    if self.checkpoint_path and time.time() - saved >= self.checkpoint_interval:
+                        self._frontier = frontier[n + chunk_size:]
+                        self._save()
+                        saved = time.time()
+                self._frontier, self._next = self._next, array.array('q')
+                self.depth += 1
+                self._save()
+
+    def _fetch(self, uid):
+        try:
+            return array.array('q', self.client.iterate(self.path, max_pages=self.max_pages, uid=uid, count=self.count))
+        except APIError as e:
+            self.errors[uid] = str(e.error_code)
+            return array.array('q')
+
+    def _add(self, uid, ids):
+        self._index[uid] = len(self._nodes)
+        self._nodes.append(uid)
+        self._offsets.append(len(self._edges))
+        self._edges.extend(ids)
+
+    def _save(self):
+        if not self.checkpoint_path:
+            return
+        state = dict(path=self.path, depth=self.depth, errors=self.errors, nodes=self._nodes, offsets=self._offsets,
+                     edges=self._edges, frontier=self._frontier, next=self._next)
+        tmp = '%s.tmp' % self.checkpoint_path
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _load(self, path):
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state['path'] != self.path:
+            raise ValueError('checkpoint %s is a crawl of %s' % (path, state['path']))
+        self.depth = state['depth']
+        self.errors = state['errors']
+        self._nodes = state['nodes']
+        self._offsets = state['offsets']
+        self._edges = state['edges']
+        self._frontier = state['frontier']
+        self._next = state['next']
+        self._index = _IdMap()
+        for i, uid in enumerate(self._nodes):
+            self._index[uid] = i
+
+
+# single id endpoint -> (batch endpoint, ids parameter, list field, error code of missing ids):
+_BATCH_ENDPOINTS = {
+    'users/show': ('users/show_batch', 'uids', 'users', '20003'),
+    'statuses/show': ('statuses/show_batch', 'ids', 'statuses', '20101'),
+}
+
+
+class BatchLoader(object):
+    """
+    gather single id lookups into requests of a batch endpoint, in the dataloader style:
+
+        users = BatchLoader(client, 'users/show')
+        futures = [users.load(uid) for uid in uids]
+        print(futures[0].result().screen_name)
+
+    load() returns a concurrent.futures.Future at once. pending ids are sent window seconds
+    after the first of them, as soon as max_batch_size are pending, or when the outermost
+    batch() scope exits, one request per max_batch_size ids. an id missing from the response
+    gets an APIError like the single id endpoint raises for a deleted user or status.
+
+    >>> class FakeClient(object):
+    ...     calls = []
+    ...     def _call(self, method, path, kw, deadline=None):
+    ...         self.calls.append((path, kw['uids']))
+    ...         return JsonDict(users=[JsonDict(id=int(uid)) for uid in kw['uids'].split(',') if uid != '404'])
+    >>> client = FakeClient()
+    >>> users = BatchLoader(client, 'users/show')
+    >>> with users.batch():
+    ...     futures = users.load_many([1, 2, 404, 1])
+    >>> [f.result().id for f in futures[:2]], futures[0] is futures[3], client.calls
+    ([1, 2], True, [('users/show_batch', '1,2,404')])
+    >>> futures[2].exception().error_code
+    '20003'
+    """
+    def __init__(self, client, path, window=0.005, max_batch_size=50, max_workers=4, **params):
+        if path not in _BATCH_ENDPOINTS:
+            raise ValueError('no batch endpoint for %s' % path)
+        self._client = client
+        self._batch_path, self._ids_param, self._field, self._missing_code = _BATCH_ENDPOINTS[path]
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_workers = max_workers
+        self._params = params
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()
+        self._timer = None
+        self._scopes = 0
+        self._executor = None
+
+    def load(self, key):
+        """
+        return a Future of the object with id key.
+        """
+        key = str(key)
+        with self._lock:
+            f = self._pending.get(key)
+            if f is not None:
+                return f
+            f = self._pending[key] = concurrent.futures.Future()
+            if len(self._pending) >= self.max_batch_size:
+                self._dispatch()
+            elif self._scopes == 0 and self._timer is None:
+                self._timer = threading.Timer(self.window, self.dispatch)
+                self._timer.daemon = True
+                self._timer.start()
+        return f
+
+    def load_many(self, keys):
+        return [self.load(key) for key in keys]
+
+    def get(self, key):
+        """
+        return the object with id key, raise APIError if it does not exist.
+        inside a batch() scope the pending ids are sent at once instead of waiting for its exit.
+        """
+        f = self.load(key)
+        with self._lock:
+            if self._scopes > 0 and not f.done():
+                self._dispatch()
+        return f.result()
+
+    def batch(self):
+        """
+        return a context which holds ids until it exits instead of window seconds:
+
+            with loader.batch():
+                futures = loader.load_many(ids)
+        """
+        return _LoaderScope(self)
+
+    def dispatch(self):
+        """
+        send all pending ids now.
+        """
+        with self._lock:
+            self._dispatch()
+
+    def _dispatch(self):
+        # must be called with self._lock held:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        pending, self._pending = list(self._pending.items()), collections.OrderedDict()
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        for n in range(0, len(pending), self.max_batch_size):
+            self._executor.submit(self._send, pending[n:n + self.max_batch_size])
+
+    def _send(self, batch):
+        kw = dict(self._params)
+        kw[self._ids_param] = ','.join(key for key, _ in batch)
+        try:
+            r = self._client._call(_HTTP_GET, self._batch_path, kw)
+        except Exception as e:
+            for _, f in batch:
+                f.set_exception(e)
+            return
+        items = r if isinstance(r, list) else r.get(self._field) or []
+        found = dict((str(_item_id(item)), item) for item in items)
+        for key, f in batch:
+            item = found.get(key)
+            if item is None:
+                f.set_exception(APIError(self._missing_code, 'id %s does not exist' % key, self._batch_path))
+            else:
+                f.set_result(item)
+
+
+class _LoaderScope(object):
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __enter__(self):
+        with self._loader._lock:
+            self._loader._scopes += 1
+        return self._loader
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._loader._lock:
+            self._loader._scopes -= 1
+            if self._loader._scopes == 0:
+                self._loader._dispatch()
+
+
+def _json_default(o):
+    # records of json_parser(records=True) are not dicts:
+    if isinstance(o, _Record):
+        return o.to_dict()
+    raise TypeError('%r is not JSON serializable' % o)
+
+
+def _dump_line(item):
+    if _fast_json is not None:
+        return _fast_json.dumps(item, default=_json_default) + b'\n'
+    return json.dumps(item, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8') + b'\n'
+
+
+class _Exporter(object):
+    """
+    base of exporters which write items in chunks of chunk_size items to files rotated by max_bytes.
+    """
+    def __init__(self, path, max_bytes=None, chunk_size=1000):
+        if max_bytes and '%' not in path:
+            raise ValueError('path must have a number format like \'out-%%04d.gz\' to rotate files: %s' % path)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.paths = []
+        self.count = 0
+        self._file = None
+        self._size = 0
+
+    def write(self, item):
+        self._add(item)
+        self.count += 1
+        if self.count % self.chunk_size == 0:
+            self._flush()
+
+    def write_all(self, items):
+        """
+        write all items of an iterable like client.iterate(...), return the number of items written.
+        """
+        n = 0
+        for item in items:
+            self.write(item)
+            n += 1
+        return n
+
+    def close(self):
+        self._flush()
+        self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, data):
+        if self._file is None:
+            path = self.path % len(self.paths) if '%' in self.path else self.path
+            self._file = open(path, 'wb')
+            self._size = 0
+            self.paths.append(path)
+            self._open_file()
+        if data:
+            self._file.write(data)
+            self._size += len(data)
+        if self.max_bytes and self._size >= self.max_bytes:
+            self._close_file()
+
+    def _close_file(self):
+        if self._file is not None:
+            tail = self._finish_file()
+            if tail:
+                self._file.write(tail)
+            self._file.close()
+            self._file = None
+
+    def _open_file(self):
+        pass
+
+    def _finish_file(self):
+        return None
+
+
+class NdjsonExporter(_Exporter):
+    """
+    write items like statuses and users as gzip-compressed NDJSON, one json object a line:
+
+        with NdjsonExporter('statuses-%04d.ndjson.gz', max_bytes=256 * 1024 * 1024) as out:
+            out.write_all(client.iterate('statuses/user_timeline', uid=123))
+
+    items are encoded as they are written and compressed every chunk_size items,
+    so memory does not grow with the number of items. files are rotated after max_bytes.
+    """
+    def __init__(self, path, max_bytes=None, chunk_size=1000, compresslevel=6):
+        super(NdjsonExporter, self).__init__(path, max_bytes, chunk_size)
+        self.compresslevel = compresslevel
+        self._lines = []
+        self._compressor = None
+
+    def _add(self, item):
+        self._lines.append(_dump_line(item))
+
+    def _flush(self):
+        if self._lines:
+            data, self._lines = b''.join(self._lines), []
+            if self._file is None:
+                self._write(b'')
+            # sync flush so that the file size tells when to rotate:
+            self._write(self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def _open_file(self):
+        self._compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def _finish_file(self):
+        return self._compressor.flush()
+
+
+# magic of files written by ColumnarExporter:
+_COLUMNAR_MAGIC = b'WEIBOCOL1\n'
+
+
+def _flatten(item, prefix, row):
+    if isinstance(item, _Record):
+        item = item.to_dict()
+    for k, v in item.items():
+        if isinstance(v, (dict, _Record)):
+            _flatten(v, '%s%s.' % (prefix, k), row)
+        else:
+            row['%s%s' % (prefix, k)] = v
+    return row
+
+
+class ColumnarExporter(_Exporter):
+    """
+    write items column by column: nested objects are flattened to fields like 'user.id', and every
+    chunk_size items are stored as one compressed block of {field: [values]}, so that the values
+    of a field, which are alike, are compressed together. if fields is given only those are kept.
+    read the files with read_columnar().
+    """
+    def __init__(self, path, max_bytes=None, chunk_size=10000, fields=None, compresslevel=6):
+        super(ColumnarExporter, self).__init__(path, max_bytes, chunk_size)
+        self.fields = fields
+        self.compresslevel = compresslevel
+        self._rows = []
+
+    def _add(self, item):
+        row = _flatten(item, '', {})
+        if self.fields is not None:
+            row = dict((f, row.get(f)) for f in self.fields)
+        self._rows.append(row)
+
+    def _flush(self):
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        names = list(self.fields) if self.fields is not None else []
+        if self.fields is None:
+            known = set()
+            for row in rows:
+                for f in row:
+                    if f not in known:
+                        known.add(f)
+                        names.append(f)
+        columns = dict((f, [row.get(f) for row in rows]) for f in names)
+        block = zlib.compress(json.dumps(dict(count=len(rows), columns=columns), ensure_ascii=False,
+                                         separators=(',', ':'), default=_json_default).encode('utf-8'), self.compresslevel)
+        self._write(struct.pack('>I', len(block)) + block)
+
+    def _open_file(self):
+        self._file.write(_COLUMNAR_MAGIC)
+        self._size += len(_COLUMNAR_MAGIC)
+
+
+def read_columnar(path):
+    """
+    yield the blocks of a file written by ColumnarExporter as dicts of field -> list of values.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(_COLUMNAR_MAGIC)) != _COLUMNAR_MAGIC:
+            raise ValueError('%s is not written by ColumnarExporter' % path)
+        while True:
+            header = f.read(4)
+            if not header:
+                return
+            size, = struct.unpack('>I', header)
+            yield json.loads(zlib.decompress(f.read(size)))['columns']
+
+
+def _project(item, fields):
+    """
+    return a copy of a dict with only the fields given as split paths.
+
+    >>> _project({'id': 1, 'text': 't', 'user': {'id': 2, 'name': 'n'}}, (('id',), ('user', 'id')))
+    {'id': 1, 'user': {'id': 2}}
+    """
+    r = {}
+    for names in fields:
+        src, dst = item, r
+        for name in names[:-1]:
+            src = src.get(name)
+            if not isinstance(src, dict):
+                break
+            dst = dst.setdefault(name, {})
+        else:
+            if names[-1] in src:
+                dst[names[-1]] = src[names[-1]]
+    return r
+
+
+def _decode_body(body, fields=None, max_size=None):
+    """
+    inflate, parse and project a response body, in a worker process of ProcessDecoder.
+    """
+    if body[:2] == b'\x1f\x8b':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = decompressor.decompress(body, max_size + 1 if max_size else 0)
+        if max_size and len(body) > max_size:
+            raise http.client.HTTPException('response body exceeds max_body_size of %d bytes' % max_size)
+    r = _fast_json.loads(body) if _fast_json else json.loads(body)
+    if not fields:
+        return r
+    if isinstance(r, list):
+        return [_project(item, fields) if isinstance(item, dict) else item for item in r]
+    if not isinstance(r, dict) or 'error_code' in r:
+        return r
+    for field, _ in _PAGED_FIELDS:
+        items = r.get(field)
+        if isinstance(items, list):
+            r[field] = [_project(item, fields) if isinstance(item, dict) else item for item in items]
+            return r
+    return _project(r, fields)
+
+
+class ProcessDecoder(object):
+    """
+    parser which inflates and parses response bodies in a pool of processes, so that
+    decoding is not held to one core by the GIL when many threads send requests:
+
+        decoder = ProcessDecoder(max_workers=4, fields=('id', 'text', 'user.id'))
+        client = APIClient(app_key, app_secret, parser=decoder)
+
+    the client hands over the raw gzip body. if fields are given only those fields of the items
+    of list responses, or of the object itself, are sent back, which makes the transfer back
+    cheaper. results are LazyJsonDict. bodies shorter than min_size bytes are decoded in the
+    calling thread, where it is cheaper than a round trip to a worker. inflated bodies are
+    limited to the smaller of max_body_size and the max_body_size of the client.
+    """
+    inflates = True
+
+    def __init__(self, max_workers=None, fields=None, min_size=16 * 1024, max_body_size=None):
+        self.max_workers = max_workers
+        self.fields = fields
+        self.min_size = min_size
+        self.max_body_size = max_body_size
+        self._fields = tuple(tuple(f.split('.')) for f in fields) if fields else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __call__(self, body, max_body_size=None):
+        body = bytes(body)
+        if max_body_size is None or (self.max_body_size is not None and self.max_body_size < max_body_size):
+            max_body_size = self.max_body_size
+        if len(body) < self.min_size:
+            return _lazy(_decode_body(body, self._fields, max_body_size))
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        return _lazy(self._executor.submit(_decode_body, body, self._fields, max_body_size).result())
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _Batch(object):
+
+    def __init__(self, client, max_workers):
+        self._client = client
+        self._max_workers = max_workers
+        self._calls = []
+        self.results = None
+
+    def add(self, executable, **kw):
+        self._calls.append((executable, kw))
+        return len(self._calls) - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.results = self._client.execute_many(self._calls, self._max_workers)
+
+
+class _AsyncBatch(_Batch):
+
+    def __enter__(self):
+        raise TypeError('use "async with client.batch()" with AsyncAPIClient')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.results = await self._client.execute_many(self._calls, self._max_workers)
 
 
 _METHOD_MAP = {
@@ -319,12 +3111,14 @@ class _Executable(object):
         self._client = client
         self._method = method
         self._path = path
+        self._method_code = _METHOD_MAP[method]
 
     def __call__(self, **kw):
-        method = _METHOD_MAP[self._method]
+        method = self._method_code
         if method == _HTTP_POST and 'pic' in kw:
             method = _HTTP_UPLOAD
-        return _http_call('%s%s.json' % (self._client.api_url, self._path), method, self._client.access_token, **kw)
+        deadline = kw.pop('deadline', None)
+        return self._client._call(method, self._path, kw, deadline)
 
     def __str__(self):
         return '_Executable (%s %s)' % (self._method, self._path)
@@ -332,6 +3126,53 @@ class _Executable(object):
     __repr__ = __str__
 
 
+class _PreparedParams(dict):
+    """parameters given at call time of a _PreparedRequest"""
+    __slots__ = ('prepared',)
+
+    def __init__(self, prepared, kw):
+        dict.__init__(self, kw)
+        self.prepared = prepared
+
+
+class _PreparedRequest(object):
+
+    def __init__(self, client, method, path, static_params):
+        self._client = client
+        self._method = method
+        self._method_code = _METHOD_MAP[method]
+        self._path = path
+        self.params = static_params
+        self.query = _encode_params(**static_params)
+        self.body = self.query.encode('utf-8')
+        self._authorization = (None, None)
+
+    def authorization(self, access_token):
+        """
+        return the Authorization header, which is only rebuilt if the token has changed.
+        """
+        token, header = self._authorization
+        if token != access_token:
+            header = 'OAuth2 %s' % access_token
+            self._authorization = (access_token, header)
+        return header
+
+    def __call__(self, **kw):
+        method = self._method_code
+        if method == _HTTP_POST and 'pic' in kw:
+            method = _HTTP_UPLOAD
+        deadline = kw.pop('deadline', None)
+        if not self.params.keys().isdisjoint(kw):
+            # values given at call time override the static ones, so the encoded query cannot be used:
+            return self._client._call(method, self._path, dict(self.params, **kw), deadline)
+        return self._client._call(method, self._path, _PreparedParams(self, kw), deadline)
+
+    def __str__(self):
+        return '_PreparedRequest (%s %s?%s)' % (self._method, self._path, self.query)
+
+    __repr__ = __str__
+
+
 class _Callable(object):
 
     def __init__(self, client, name):
@@ -340,11 +3181,15 @@ class _Callable(object):
 
     def __getattr__(self, attr):
         if attr == 'get':
-            return _Executable(self._client, 'GET', self._name)
-        if attr == 'post':
-            return _Executable(self._client, 'POST', self._name)
-        name = '%s/%s' % (self._name, attr)
-        return _Callable(self._client, name)
+            r = self._client.endpoint(self._name, 'GET')
+        elif attr == 'post':
+            r = self._client.endpoint(self._name, 'POST')
+        else:
+            r = _Callable(self._client, '%s/%s' % (self._name, attr))
+        if not attr.startswith('_'):
+            # memoize, __getattr__ is not called again for this attr:
+            self.__dict__[attr] = r
+        return r
 
     def __str__(self):
         return '_Callable (%s)' % self._name
@@ -352,6 +3197,367 @@ class _Callable(object):
     __repr__ = __str__
 
 
+class _AsyncResponse(object):
+    """
+    response read by AsyncHttpConnectionPool, with the same status, headers and read() as a pooled response.
+    """
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._body = body
+
+    def read(self, amt=None):
+        body, self._body = self._body, b''
+        return body
+
+    def close(self):
+        pass
+
+
+class _AsyncConnection(object):
+    """
+    a HTTP/1.1 keep-alive connection on asyncio streams.
+    """
+    def __init__(self, host, reader, writer):
+        self.host = host
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, method, target, body, headers, timing=None, max_size=None):
+        start = time.perf_counter()
+        lines = ['%s %s HTTP/1.1' % (method, target), 'Host: %s' % self.host]
+        for k, v in headers.items():
+            lines.append('%s: %s' % (k, v))
+        if body is not None and 'Content-Length' not in headers:
+            lines.append('Content-Length: %d' % len(body))
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if isinstance(body, bytes):
+            self.writer.write(body)
+        elif body is not None:
+            # streaming body like _MultipartBody:
+            for chunk in body:
+                self.writer.write(chunk)
+                await self.writer.drain()
+        await self.writer.drain()
+        return await self._read_response(timing, start, max_size)
+
+    async def _read_response(self, timing=None, start=None, max_size=None):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise http.client.RemoteDisconnected('Remote end closed connection without response')
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + [''])[:3]
+        header_lines = []
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            header_lines.append(line.decode('latin-1'))
+        headers = email.parser.Parser(_class=http.client.HTTPMessage).parsestr(''.join(header_lines))
+        if timing is not None:
+            timing.ttfb = time.perf_counter() - start
+            start = time.perf_counter()
+        limit = None
+        if max_size is not None:
+            # the body is still compressed here, deflate stores incompressible data with a few bytes more:
+            limit = max_size + max_size // 8192 + 1024 if headers.get('Content-Encoding', '') == 'gzip' else max_size
+        chunks = []
+        received = 0
+        chunked = headers.get('Transfer-Encoding', '').lower() == 'chunked'
+        length = None if chunked or headers.get('Content-Length') is None else int(headers['Content-Length'])
+        while True:
+            if chunked:
+                size = int((await self.reader.readline()).split(b';', 1)[0], 16)
+                if size == 0:
+                    # skip trailers:
+                    while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+            elif length is not None:
+                size = min(length - received, _READ_CHUNK_SIZE)
+                if size == 0:
+                    break
+            else:
+                size = None
+            if limit is not None and received + (size or 0) > limit:
+                raise http.client.HTTPException('response body exceeds max_body_size of %d bytes' % max_size)
+            if size is None:
+                chunk = await self.reader.read(_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+            else:
+                chunk = await self.reader.readexactly(size)
+                if chunked:
+                    await self.reader.readexactly(2)
+            chunks.append(chunk)
+            received += len(chunk)
+        if limit is not None and received > limit:
+            raise http.client.HTTPException('response body exceeds max_body_size of %d bytes' % max_size)
+        body = b''.join(chunks)
+        if timing is not None:
+            timing.body = time.perf_counter() - start
+        self.will_close = version == 'HTTP/1.0' or headers.get('Connection', '').lower() == 'close' or self.reader.at_eof()
+        return _AsyncResponse(int(status), reason, headers, body)
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncHttpConnectionPool(object):
+    """
+    pool of keep-alive connections for asyncio, at most maxsize connections for each (scheme, host).
+
+    connections and limits are kept apart for each event loop, so that the pool can be
+    used by several asyncio.run() calls one after another.
+    """
+    def __init__(self, maxsize=10, ssl_context=None):
+        self.maxsize = maxsize
+        self.ssl_context = ssl_context
+        # event loop -> (idle connections, semaphores) by (scheme, host):
+        self._loops = weakref.WeakKeyDictionary()
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = ({}, {})
+        return state
+
+    async def urlopen(self, method, url, body=None, headers=None, timeout=None, timing=None, max_body_size=None):
+        """
+        send a request and return the response read to the end, raise HTTPException
+        as soon as more than about max_body_size bytes of body are received.
+        """
+        scheme, netloc, path, query, _ = urlsplit(url)
+        key = (scheme, netloc)
+        target = '%s?%s' % (path, query) if query else path
+        idle, slots = self._state()
+        if key not in slots:
+            slots[key] = asyncio.Semaphore(self.maxsize)
+        async with slots[key]:
+            return await asyncio.wait_for(self._urlopen(idle.setdefault(key, []), key, method, target, body, headers or {}, timing,
+                                                       max_body_size), timeout)
+
+    async def _urlopen(self, idle, key, method, target, body, headers, timing=None, max_body_size=None):
+        conn = idle.pop() if idle else None
+        try:
+            if conn is not None:
+                if timing is not None:
+                    timing.reused = True
+                try:
+                    resp = await conn.request(method, target, body, headers, timing, max_body_size)
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
+                    # the server closed an idle keep-alive connection, try once more on a new socket:
+                    conn.close()
+                    conn = None
+            if conn is None:
+                if timing is not None:
+                    timing.reused = False
+                    start = time.perf_counter()
+                conn = await self._connect(key)
+                if timing is not None:
+                    # asyncio opens the connection and does the tls handshake in one step:
+                    timing.connect = time.perf_counter() - start
+                resp = await conn.request(method, target, body, headers, timing, max_body_size)
+        except:
+            if conn is not None:
+                conn.close()
+            raise
+        if conn.will_close:
+            conn.close()
+        else:
+            idle.append(conn)
+        return resp
+
+    async def _connect(self, key):
+        scheme, netloc = key
+        host, _, port = netloc.partition(':')
+        if scheme == 'https':
+            context = self.ssl_context or ssl.create_default_context()
+            reader, writer = await asyncio.open_connection(host, int(port or 443), ssl=context)
+        else:
+            reader, writer = await asyncio.open_connection(host, int(port or 80))
+        return _AsyncConnection(netloc, reader, writer)
+
+    def clear(self):
+        """
+        close all idle connections, those of closed event loops are dropped.
+        """
+        loops = list(self._loops.items())
+        self._loops.clear()
+        for loop, (idle, _) in loops:
+            if loop.is_closed():
+                continue
+            for conns in idle.values():
+                for conn in conns:
+                    conn.close()
+
+
+async def _async_http_request(pool, the_url, method, authorization, kw, max_body_size=None, parser=_parse_json, timing=None, timeout=5.0):
+    """
+    asyncio version of _http_request().
+    """
+    if timing is None:
+        http_method, http_url, http_body, headers = _prepare_request(the_url, method, authorization, kw)
+        resp = await pool.urlopen(http_method, http_url, http_body, headers, timeout=timeout, max_body_size=max_body_size)
+        body = _read_body(resp, max_body_size, inflate=_inflate_in_thread(resp, parser))
+        return _parse_response(http_url, resp, body, parser, max_body_size=max_body_size)
+    start = time.perf_counter()
+    try:
+        http_method, http_url, http_body, headers = _prepare_request(the_url, method, authorization, kw)
+        timing.method = http_method
+        resp = await pool.urlopen(http_method, http_url, http_body, headers, timeout=timeout, timing=timing,
+                                  max_body_size=max_body_size)
+        timing.status = resp.status
+        body = _read_body(resp, max_body_size, timing, _inflate_in_thread(resp, parser))
+        return _parse_response(http_url, resp, body, parser, timing, max_body_size)
+    except APIError as e:
+        timing.error_code = str(e.error_code)
+        raise
+    except Exception as e:
+        timing.error_code = e.__class__.__name__
+        raise
+    finally:
+        timing.total = time.perf_counter() - start
+
+
+class AsyncAPIClient(APIClient):
+    """
+    API client using asyncio. Every api call returns an awaitable:
+
+        r = await client.statuses.home_timeline.get(count=20)
+
+    At most max_concurrency calls are sent at the same time in each event loop.
+    cache, rate limiter, retry, single flight, stream() and loader() of APIClient
+    are blocking and not supported.
+    """
+    def __init__(self, app_key, app_secret, redirect_uri=None, response_type='code', domain='api.weibo.com', version='2', pool=None, max_body_size=None, parser=None, max_concurrency=100, metrics=None, timeout=5.0, timeouts=None, **kw):
+        for name in kw:
+            if name in ('cache', 'rate_limiter', 'retry', 'single_flight'):
+                raise TypeError('AsyncAPIClient does not support %s' % name)
+            raise TypeError('AsyncAPIClient() got an unexpected keyword argument %r' % name)
+        super(AsyncAPIClient, self).__init__(app_key, app_secret, redirect_uri, response_type, domain, version,
+                                             pool=pool or AsyncHttpConnectionPool(), max_body_size=max_body_size, parser=parser,
+                                             metrics=metrics, timeout=timeout, timeouts=timeouts)
+        self.max_concurrency = max_concurrency
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def request_access_token(self, code, redirect_uri=None):
+        redirect = redirect_uri if redirect_uri else self.redirect_uri
+        if not redirect:
+            raise APIError('21305', 'Parameter absent: redirect_uri', 'OAuth2 request')
+        r = await _async_http_request(self.pool, '%s%s' % (self.auth_url, 'access_token'), _HTTP_POST, None,
+                                      dict(client_id=self.client_id,
+                                           client_secret=self.client_secret,
+                                           redirect_uri=redirect,
+                                           code=code,
+                                           grant_type='authorization_code'))
+        return self._parse_access_token(r)
+
+    async def refresh_token(self, refresh_token):
+        r = await _async_http_request(self.pool, '%s%s' % (self.auth_url, 'access_token'), _HTTP_POST, None,
+                                      dict(client_id=self.client_id,
+                                           client_secret=self.client_secret,
+                                           refresh_token=refresh_token,
+                                           grant_type='refresh_token'))
+        return self._parse_access_token(r)
+
+    async def execute_many(self, calls, max_workers=8):
+        """
+        run many api calls concurrently and return their results in order, like APIClient.execute_many().
+        """
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def _run(call):
+            fn, kw = call
+            async with semaphore:
+                try:
+                    return await fn(**kw)
+                except Exception as e:
+                    return e
+        return await asyncio.gather(*[_run(call) for call in calls])
+
+    def batch(self, max_workers=8):
+        """
+        return a context that collects api calls and runs them with execute_many() on exit:
+
+            async with client.batch() as b:
+                for uid in uids:
+                    b.add(client.users.show.get, uid=uid)
+            users = b.results
+        """
+        return _AsyncBatch(self, max_workers)
+
+    async def iterate(self, path, prefetch=False, max_pages=None, deadline=None, **kw):
+        """
+        asynchronously yield items of a paged GET endpoint like APIClient.iterate():
+
+            async for st in client.iterate('statuses/user_timeline', uid=123, count=100):
+                print(st.text)
+        """
+        params = dict(kw)
+        future = None
+        try:
+            r = await self._call(_HTTP_GET, path, params, deadline)
+            pages = 1
+            seen = set()
+            while True:
+                items, next_params = _next_page(r, params)
+                if max_pages is not None and pages >= max_pages:
+                    next_params = None
+                if next_params is not None and prefetch:
+                    future = asyncio.ensure_future(self._call(_HTTP_GET, path, next_params, deadline))
+                page_ids = set()
+                for item in items:
+                    item_id = _item_id(item)
+                    page_ids.add(item_id)
+                    if item_id not in seen:
+                        yield item
+                if next_params is None or not (page_ids - seen):
+                    break
+                seen = page_ids
+                params = next_params
+                if future is not None:
+                    r, future = await future, None
+                else:
+                    r = await self._call(_HTTP_GET, path, params, deadline)
+                pages += 1
+        finally:
+            if future is not None:
+                future.cancel()
+
+    def stream(self, path, **kw):
+        raise TypeError('AsyncAPIClient does not support stream(), use iterate() instead')
+
+    def loader(self, path, **params):
+        raise TypeError('AsyncAPIClient does not support loader(), use execute_many() instead')
+
+    def seed_rate_limit(self):
+        raise TypeError('AsyncAPIClient does not support rate limiter')
+
+    async def _call(self, method, path, kw, deadline=None):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        timing = RequestTiming(path) if self.metrics is not None else None
+        async with semaphore:
+            # the time waiting for the semaphore counts against the deadline:
+            timeout = self._timeout(path, deadline)
+            try:
+                return await _async_http_request(self.pool, self._api_url(path), method, self.access_token, kw,
+                                                 self.max_body_size, self.parser, timing, timeout)
+            finally:
+                if timing is not None:
+                    self.metrics.report(timing)
+
+    async def close(self):
+        """
+        close idle connections of the pool.
+        """
+        self.pool.clear()
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()